@@ -58,11 +58,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
-    'core.middleware.AccessControlMiddleware',  # <-- Comment this out for now
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'core.middleware.AccessControlMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -174,8 +174,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # === Allauth Settings ===
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
-    'allauth.account.auth_backends.AuthenticationBackend',
+    # The stock ModelBackend / allauth backend, loading User and Profile together.
+    'core.backends.ProfileModelBackend',
+    'core.backends.ProfileAuthenticationBackend',
 ]
 
 SITE_ID = 1
@@ -203,10 +204,47 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Email Configuration for Gmail
+# Notification mail is queued in core.OutboundEmail and delivered by
+# `manage.py send_queued_mail`, which must run alongside the web workers.
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_USER')
-EMAIL_HOST_PASSWORD = config('EMAIL_PASS')
\ No newline at end of file
+EMAIL_HOST_PASSWORD = config('EMAIL_PASS')
+
+# === Recommender ===
+# 'python' scores with the reference loop in core/recommender.py.
+# 'numpy' uses the vectorized engine in core/vector_recommender.py (same rankings).
+RECOMMENDER_ENGINE = 'python'
+
+# Set to True once `manage.py precompute_recommendations` runs on a schedule:
+# dashboards then serve the stored rows even when stale and only score live
+# for users who have no row yet.
+RECOMMENDATIONS_PRECOMPUTED = False
+
+# Backend for find_alumni's word search (core/search.py): 'mysql' uses the
+# FULLTEXT index on Profile.search_text, 'memory' an in-process inverted
+# index; 'auto' picks 'mysql' on MySQL and 'memory' otherwise.
+PROFILE_SEARCH_BACKEND = 'auto'
+
+# === Cache ===
+# Holds the connection-graph adjacency sets (core/graph.py) and the recommender
+# snapshot version. LocMemCache is per process, so another worker's adjacency
+# sets can lag a change by up to graph.ADJACENCY_TTL; point this at the Redis
+# server used by CHANNEL_LAYERS to share it between workers.
+#
+# 'presence' holds the online socket counts (messaging/presence.py). Every
+# ASGI worker must see the same counts, so it has to be a shared backend:
+# the Redis server used by CHANNEL_LAYERS, in its own database.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'presence': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
@@ -1,7 +1,11 @@
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.forms.models import BaseInlineFormSet
+from . import autocomplete, result_cache
 from .models import Profile
+from .recommender import mark_recommendations_stale
+from .vector_recommender import invalidate_snapshot
 
 # Unregister the default User admin to use our custom one
 admin.site.unregister(User)
@@ -18,6 +22,11 @@ def verify_selected_profiles(modeladmin, request, queryset):
         fraud_warning=None,
         has_seen_verification_message=False
     )
+    # .update() bypasses post_save, so refresh cached recommendations explicitly.
+    mark_recommendations_stale()
+    invalidate_snapshot()
+    autocomplete.invalidate()
+    result_cache.invalidate()
     
     if profiles_updated > 0:
         modeladmin.message_user(request, f"{profiles_updated} user(s) have been successfully verified.", messages.SUCCESS)
@@ -36,6 +45,10 @@ def mark_as_fraudulent(modeladmin, request, queryset):
         is_verified=False,
         fraud_warning=reason
     )
+    mark_recommendations_stale()
+    invalidate_snapshot()
+    autocomplete.invalidate()
+    result_cache.invalidate()
 
     if profiles_updated > 0:
         modeladmin.message_user(request, f"{profiles_updated} user(s) have been marked as fraudulent.", messages.WARNING)
@@ -43,12 +56,23 @@ def mark_as_fraudulent(modeladmin, request, queryset):
         modeladmin.message_user(request, "No profiles were found to mark as fraudulent for the selected users.", messages.WARNING)
 
 
+class ProfileInlineFormSet(BaseInlineFormSet):
+    def save_existing(self, form, obj, commit=True):
+        # Write only the edited columns, so e.g. editing a fraud warning
+        # isn't treated as a change to anything the rankings use.
+        profile = form.save(commit=False)
+        if commit:
+            profile.save(update_fields=form.changed_data)
+        return profile
+
+
 @admin.register(User)
 class CustomUserAdmin(BaseUserAdmin):
     """ Custom User admin that includes Profile information. """
 
     class ProfileInline(admin.StackedInline):
         model = Profile
+        formset = ProfileInlineFormSet
         can_delete = False
         verbose_name_plural = 'User Profile'
         fk_name = 'user'
@@ -0,0 +1,246 @@
+# core/autocomplete.py
+#
+# Typeahead suggestions for the find_alumni form: distinct names, companies
+# and departments of verified alumni, each weighted by how many alumni have
+# it. Every process keeps a sorted array of (key, field, value) entries, so a
+# prefix is one bisect plus a scan of the matching run; a value is reachable
+# from the start of each of its words ("nair" finds "Priya Nair"). One- and
+# two-letter prefixes match the longest runs, so their answers are computed
+# when the index is built; longer ones are memoized between profile changes.
+#
+# Profile saves patch the local copy and bump a shared cache version, which
+# makes other processes rebuild (the same scheme as core.search and the
+# recommender's ProfileMatrix). A rebuild runs on a background thread while
+# requests keep using the old index; only a process's first request builds
+# in-line, since it has nothing to serve yet.
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+
+from .models import Profile
+
+# Form field -> Profile column.
+FIELDS = {'name': 'full_name', 'company': 'company_name', 'department': 'department'}
+# Profile columns whose changes can add or remove suggestions.
+SUGGESTION_SOURCE_FIELDS = frozenset({*FIELDS.values(), 'is_verified', 'user_type'})
+
+INDEX_VERSION_KEY = 'autocomplete:index_version'
+INDEX_MAX_AGE = 300
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+# Prefixes up to this long have their answers computed when the index is built.
+SHORT_PREFIX_LENGTH = 2
+# Longer-prefix answers remembered per process between profile changes.
+ANSWER_CACHE_SIZE = 1000
+
+_index = None
+_rebuild_lock = threading.Lock()
+_rebuilding = False
+
+
+def _normalize(value):
+    return ' '.join((value or '').lower().split())
+
+
+def _profile_values(full_name, company_name, department):
+    """The (field, display value) pairs one alumnus contributes."""
+    return tuple(
+        (field, ' '.join(value.split()))
+        for field, value in zip(FIELDS, (full_name, company_name, department))
+        if value and value.strip()
+    )
+
+
+class PrefixIndex:
+    """Sorted (key, field, normalized value) entries plus per-value alumni counts."""
+
+    def __init__(self, rows=(), version=0):
+        self.version = version
+        self.built_at = time.monotonic()
+        self._counts = {}  # (field, normalized) -> alumni count
+        self._display = {}  # (field, normalized) -> value as first seen
+        self._contributions = {}  # profile id -> its (field, value) pairs
+        self._keys = []
+        # (prefix, field) -> best slots. Short prefixes match the longest runs,
+        # so they are all computed up front and only dropped when a change
+        # touches them; longer ones are memoized until the next change.
+        self._short = {}
+        self._answers = {}
+        self._lock = threading.Lock()
+        for profile_id, *values in rows:
+            self._contribute(profile_id, _profile_values(*values), sort=False)
+        self._keys.sort()
+        self._warm_short_prefixes()
+
+    @classmethod
+    def build(cls, version=0):
+        rows = Profile.objects.filter(is_verified=True, user_type='alumni').values_list(
+            'id', 'full_name', 'company_name', 'department'
+        )
+        return cls(rows.iterator(chunk_size=2000), version)
+
+    @staticmethod
+    def _entries(field, normalized):
+        words = normalized.split()
+        return {(' '.join(words[start:]), field, normalized) for start in range(len(words))}
+
+    def _rank(self, slot):
+        return -self._counts[slot], slot[1]
+
+    def _warm_short_prefixes(self):
+        buckets = defaultdict(set)
+        for key, field, normalized in self._keys:
+            for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                buckets[key[:length], field].add((field, normalized))
+                buckets[key[:length], None].add((field, normalized))
+        self._short = {
+            bucket: heapq.nsmallest(MAX_SUGGESTIONS, slots, key=self._rank)
+            for bucket, slots in buckets.items()
+        }
+
+    def _touched(self, slot):
+        """Forgets every answer the slot can appear in."""
+        self._answers.clear()
+        for key, field, _ in self._entries(*slot):
+            for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                self._short.pop((key[:length], field), None)
+                self._short.pop((key[:length], None), None)
+
+    def _contribute(self, profile_id, values, sort=True):
+        self._contributions[profile_id] = values
+        for field, value in values:
+            slot = (field, _normalize(value))
+            if sort:
+                self._touched(slot)
+            if slot in self._counts:
+                self._counts[slot] += 1
+                continue
+            self._counts[slot] = 1
+            self._display[slot] = value
+            for entry in self._entries(*slot):
+                if sort:
+                    insort(self._keys, entry)
+                else:
+                    self._keys.append(entry)
+
+    def _withdraw(self, profile_id):
+        for field, value in self._contributions.pop(profile_id, ()):
+            slot = (field, _normalize(value))
+            self._touched(slot)
+            self._counts[slot] -= 1
+            if self._counts[slot]:
+                continue
+            del self._counts[slot], self._display[slot]
+            for entry in self._entries(*slot):
+                del self._keys[bisect_left(self._keys, entry)]
+
+    def update(self, profile_id, values):
+        """Replaces one profile's contribution; `values` is None if it shouldn't suggest anything."""
+        with self._lock:
+            self._withdraw(profile_id)
+            if values:
+                self._contribute(profile_id, values)
+
+    def _scan(self, prefix, field):
+        keys = self._keys
+        matches = set()
+        position = bisect_left(keys, (prefix,))
+        while position < len(keys) and keys[position][0].startswith(prefix):
+            _, entry_field, normalized = keys[position]
+            if field is None or entry_field == field:
+                matches.add((entry_field, normalized))
+            position += 1
+        return heapq.nsmallest(MAX_SUGGESTIONS, matches, key=self._rank)
+
+    def suggest(self, prefix, field=None, limit=DEFAULT_SUGGESTIONS):
+        """The `limit` most common values with a word starting with `prefix`."""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            answers = self._short if len(prefix) <= SHORT_PREFIX_LENGTH else self._answers
+            best = answers.get((prefix, field))
+            if best is None:
+                best = answers[prefix, field] = self._scan(prefix, field)
+                if len(self._answers) > ANSWER_CACHE_SIZE:
+                    self._answers.pop(next(iter(self._answers)))
+            return [
+                {'field': slot[0], 'value': self._display[slot], 'count': self._counts[slot]}
+                for slot in best[:limit]
+            ]
+
+
+def get_index():
+    """
+    Returns this process's PrefixIndex. An outdated index is still returned
+    while its replacement is built in the background.
+    """
+    global _index
+    version = cache.get(INDEX_VERSION_KEY, 0)
+    index = _index
+    if index is None:
+        index = _index = PrefixIndex.build(version)
+    elif index.version != version or time.monotonic() - index.built_at > INDEX_MAX_AGE:
+        _rebuild_in_background(version)
+    return index
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    with _rebuild_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, args=(version,), name='autocomplete-index-rebuild', daemon=True).start()
+
+
+def _rebuild(version):
+    global _index, _rebuilding
+    # Runs outside any request, so manage this thread's connection here.
+    close_old_connections()
+    try:
+        index = PrefixIndex.build(version)
+        # Don't replace a copy that profile_changed() patched past `version` meanwhile.
+        if _index is None or _index.version <= version:
+            _index = index
+    except Exception:
+        # Keep serving the old index; the next request tries again.
+        pass
+    finally:
+        connections.close_all()
+        _rebuilding = False
+
+
+def _bump_version():
+    try:
+        return cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, 1, None)
+        return 1
+
+
+def profile_changed(profile, deleted=False):
+    """Keeps suggestions current after a profile is saved or deleted."""
+    index = _index
+    version = _bump_version()
+    # Other processes rebuild on the new version; this one patches its copy.
+    if index is not None and index.version == version - 1:
+        suggests = not deleted and profile.is_verified and profile.user_type == 'alumni'
+        values = _profile_values(profile.full_name, profile.company_name, profile.department) if suggests else None
+        index.update(profile.pk, values)
+        index.version = version
+
+
+def invalidate():
+    """Forces every process to rebuild its suggestions, e.g. after a bulk update()."""
+    _bump_version()
+
+
+def suggest(prefix, field=None, limit=DEFAULT_SUGGESTIONS):
+    return get_index().suggest(prefix, field, min(limit, MAX_SUGGESTIONS))
@@ -0,0 +1,36 @@
+# core/backends.py
+#
+# The project's authentication backends, identical to the stock ones except
+# that the session user is loaded together with its Profile in one query.
+# Nearly every page reads request.user.profile, which would otherwise cost a
+# second query on each request.
+
+from allauth.account.auth_backends import AuthenticationBackend
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+# Session backend paths written before these backends existed, mapped to
+# their replacements so existing sessions stay logged in (see ProfileMiddleware).
+LEGACY_BACKENDS = {
+    'django.contrib.auth.backends.ModelBackend': 'core.backends.ProfileModelBackend',
+    'allauth.account.auth_backends.AuthenticationBackend': 'core.backends.ProfileAuthenticationBackend',
+}
+
+
+class ProfileUserMixin:
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+class ProfileModelBackend(ProfileUserMixin, ModelBackend):
+    pass
+
+
+class ProfileAuthenticationBackend(ProfileUserMixin, AuthenticationBackend):
+    pass
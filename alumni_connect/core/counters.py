@@ -0,0 +1,107 @@
+# core/counters.py
+#
+# Maintenance of UserCounters, the per-user badge counts shown in the sidebar.
+# Callers adjust them in the same transaction as the rows they change;
+# `manage.py reconcile_counters` recomputes them from the source tables.
+
+from collections import defaultdict
+
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Connection, Notification, UserCounters
+
+COUNTER_FIELDS = ('unread_notifications', 'pending_requests', 'unread_conversations')
+
+
+def compute_counters(user_ids=None):
+    """
+    Counts every badge from the source tables for the given users (or
+    everyone). Returns {user_id: {field: value}}, omitting all-zero users.
+    """
+    from messaging.utils import unread_conversation_counts
+
+    notifications = Notification.objects.filter(is_read=False)
+    requests = Connection.objects.filter(status=Connection.Status.PENDING)
+    if user_ids is not None:
+        notifications = notifications.filter(recipient_id__in=user_ids)
+        requests = requests.filter(receiver_id__in=user_ids)
+
+    counts = {}
+    sources = (
+        ('unread_notifications', notifications.order_by().values('recipient_id').annotate(n=Count('id')).values_list('recipient_id', 'n')),
+        ('pending_requests', requests.order_by().values('receiver_id').annotate(n=Count('id')).values_list('receiver_id', 'n')),
+        ('unread_conversations', unread_conversation_counts(user_ids).items()),
+    )
+    for field, rows in sources:
+        for user_id, value in rows:
+            counts.setdefault(user_id, dict.fromkeys(COUNTER_FIELDS, 0))[field] = value
+    return counts
+
+
+def recompute(user_id):
+    """Rebuilds one user's row from the source tables and returns it."""
+    values = compute_counters([user_id]).get(user_id, dict.fromkeys(COUNTER_FIELDS, 0))
+    counters, _ = UserCounters.objects.update_or_create(user_id=user_id, defaults=values)
+    return counters
+
+
+def get_counters(user):
+    """The user's UserCounters row (one PK lookup), built on first use."""
+    counters = UserCounters.objects.filter(pk=user.pk).first()
+    return counters if counters is not None else recompute(user.pk)
+
+
+def adjust(user_id, **deltas):
+    """
+    Applies relative changes, e.g. adjust(uid, unread_notifications=1), as one
+    UPDATE clamped at zero. A user without a row gets one built from source,
+    which already reflects the change that triggered the call.
+    """
+    updated = UserCounters.objects.filter(pk=user_id).update(**{
+        field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()
+    })
+    if not updated:
+        recompute(user_id)
+
+
+def adjust_many(field, deltas):
+    """
+    adjust() for many users at once: `deltas` maps user_id to the change in
+    `field`. Runs one UPDATE per distinct delta (per 1000 users) and builds
+    the rows that don't exist yet from source in one pass.
+    """
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        for start in range(0, len(user_ids), 1000):
+            UserCounters.objects.filter(pk__in=user_ids[start:start + 1000]).update(
+                **{field: Greatest(F(field) + delta, 0)}
+            )
+
+    user_ids = [user_id for ids in by_delta.values() for user_id in ids]
+    existing = set()
+    for start in range(0, len(user_ids), 1000):
+        existing.update(UserCounters.objects.filter(pk__in=user_ids[start:start + 1000]).values_list('pk', flat=True))
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        counts = compute_counters(missing)
+        UserCounters.objects.bulk_create(
+            [UserCounters(user_id=user_id, **counts.get(user_id, dict.fromkeys(COUNTER_FIELDS, 0))) for user_id in missing],
+            batch_size=1000, ignore_conflicts=True,
+        )
+
+
+def refresh_unread_conversations(user_ids):
+    """Unread conversations aren't a simple delta; recount them for the given users."""
+    from messaging.utils import unread_conversation_counts
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    unread = unread_conversation_counts(user_ids)
+    for user_id in user_ids:
+        if not UserCounters.objects.filter(pk=user_id).update(unread_conversations=unread.get(user_id, 0)):
+            recompute(user_id)
@@ -10,11 +10,10 @@ def verification_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         # Check if the user has a profile and is authenticated
-        if not request.user.is_authenticated or not hasattr(request.user, 'profile'):
+        profile = getattr(request, 'profile', None)
+        if not request.user.is_authenticated or profile is None:
             # This should be handled by @login_required, but it's a good safeguard
             return redirect('core:login')
-
-        profile = request.user.profile
         
         # THE CORE LOGIC: Check if the user is unverified OR has a fraud warning
         if not profile.is_verified or profile.fraud_warning:
@@ -0,0 +1,94 @@
+# core/graph.py
+#
+# Adjacency-set index over accepted Connection rows.
+#
+# Each user's set of accepted neighbours is stored in the Django cache
+# (in-process memory with the default LocMemCache, shared between workers
+# when a Redis/Memcached backend is configured). Reads never touch the
+# database once a user's row is cached; a missing row is rebuilt together
+# with any other missing rows in a single query.
+#
+# invalidate() can only delete rows from the cache it runs against, so with a
+# per-process cache other workers hold stale rows until ADJACENCY_TTL expires.
+
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Connection
+
+ADJACENCY_KEY = 'graph:adjacency:{}'
+# Upper bound on how stale another process's row can be (the same 300 s as the
+# search, autocomplete and recommender snapshots).
+ADJACENCY_TTL = 300
+
+
+def _key(user_id):
+    return ADJACENCY_KEY.format(user_id)
+
+
+def neighbors_many(user_ids):
+    """Returns {user_id: frozenset of accepted neighbour ids} for every id given."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    cached = cache.get_many([_key(user_id) for user_id in user_ids])
+    adjacency = {user_id: cached[_key(user_id)] for user_id in user_ids if _key(user_id) in cached}
+
+    missing = user_ids - adjacency.keys()
+    if missing:
+        loaded = {user_id: set() for user_id in missing}
+        edges = Connection.objects.filter(
+            Q(sender_id__in=missing) | Q(receiver_id__in=missing),
+            status=Connection.Status.ACCEPTED
+        ).values_list('sender_id', 'receiver_id')
+        for sender_id, receiver_id in edges:
+            if sender_id in loaded:
+                loaded[sender_id].add(receiver_id)
+            if receiver_id in loaded:
+                loaded[receiver_id].add(sender_id)
+        loaded = {user_id: frozenset(ids) for user_id, ids in loaded.items()}
+        cache.set_many({_key(user_id): ids for user_id, ids in loaded.items()}, ADJACENCY_TTL)
+        adjacency.update(loaded)
+    return adjacency
+
+
+def neighbors(user_id):
+    """The ids of everyone with an accepted connection to user_id."""
+    return neighbors_many([user_id])[user_id]
+
+
+def degree(user_id):
+    """Number of accepted connections; used for the dashboard counters."""
+    return len(neighbors(user_id))
+
+
+def mutual_count(user_a, user_b):
+    """Number of accepted connections the two users have in common."""
+    adjacency = neighbors_many([user_a, user_b])
+    return len(adjacency[user_a] & adjacency[user_b])
+
+
+def second_degree_counts(user_id):
+    """
+    Counter of friends-of-friends -> number of mutual connections, excluding
+    the user and their direct connections. O(sum of friends' degrees).
+    """
+    direct = neighbors(user_id)
+    counts = Counter()
+    for friend_neighbors in neighbors_many(direct).values():
+        for candidate_id in friend_neighbors:
+            if candidate_id != user_id and candidate_id not in direct:
+                counts[candidate_id] += 1
+    return counts
+
+
+def invalidate(*user_ids):
+    """
+    Drops the cached rows for the given users once the current transaction
+    commits, so a concurrent reader can't re-cache the pre-commit state.
+    """
+    keys = [_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
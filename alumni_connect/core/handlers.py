@@ -0,0 +1,96 @@
+# core/handlers.py
+#
+# Signal handlers that keep denormalized data (cached recommendations, etc.)
+# in sync with the source tables. They live here rather than in signals.py
+# because that module's profile-creating receiver is intentionally not wired
+# up: register_view creates the Profile itself.
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import autocomplete, graph, result_cache, search
+from .models import Profile, Connection, SearchHistory
+from .recommender import SCORING_FIELDS, mark_recommendations_stale
+from .tokens import search_text
+from .vector_recommender import invalidate_snapshot
+
+
+def _changed_fields(instance, created, update_fields):
+    """
+    The fields a Profile save actually changed, or None when that isn't known
+    (a new profile, or an instance that wasn't loaded from the database).
+    """
+    changed = None if created else instance.changed_fields()
+    if update_fields is None:
+        return changed
+    return set(update_fields) if changed is None else changed.intersection(update_fields)
+
+
+@receiver(post_save, sender=Profile)
+def profile_indexed(sender, instance, created, update_fields=None, **kwargs):
+    changed = _changed_fields(instance, created, update_fields)
+    if changed is None or 'search_text' in changed:
+        search.index_profile(instance)
+        # Searchable text changed; scoring fields are handled in profile_saved.
+        result_cache.invalidate(None if instance.user_type == 'alumni' else [instance.user_id])
+    if changed is None or autocomplete.SUGGESTION_SOURCE_FIELDS.intersection(changed):
+        autocomplete.profile_changed(instance)
+
+
+@receiver(post_delete, sender=Profile)
+def profile_deleted(sender, instance, **kwargs):
+    search.unindex_profile(instance)
+    autocomplete.profile_changed(instance, deleted=True)
+
+
+@receiver(post_save, sender=User)
+def username_changed(sender, instance, created, update_fields=None, **kwargs):
+    # The username is part of Profile.search_text; logins only touch last_login.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    profile = Profile.objects.filter(user=instance).first()
+    if profile is not None and profile.search_text != search_text(profile, instance.username):
+        profile.user = instance
+        profile.save(update_fields=['search_text'])
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Settings toggles, last_seen and other non-scoring saves leave every
+    # ranking as it was.
+    changed = _changed_fields(instance, created, update_fields)
+    if changed is not None and not SCORING_FIELDS.intersection(changed):
+        return
+
+    if instance.user_type == 'alumni':
+        # An alumnus can appear in (or drop out of) anyone's list.
+        mark_recommendations_stale()
+        invalidate_snapshot()
+        result_cache.invalidate()
+    else:
+        mark_recommendations_stale([instance.user_id])
+        result_cache.invalidate([instance.user_id])
+
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def connection_changed(sender, instance, **kwargs):
+    # Pending requests don't affect scores; only accepted edges do.
+    if instance.status != Connection.Status.ACCEPTED:
+        return
+
+    # Both endpoints change their first-degree set, and everyone connected to
+    # them gains or loses a friend-of-friend.
+    endpoints = {instance.sender_id, instance.receiver_id}
+    neighbor_ids = set().union(*graph.neighbors_many(endpoints).values())
+    mark_recommendations_stale(endpoints | neighbor_ids)
+    result_cache.invalidate(endpoints | neighbor_ids)
+    graph.invalidate(*endpoints)
+
+
+@receiver(post_save, sender=SearchHistory)
+def search_recorded(sender, instance, created, **kwargs):
+    if created:
+        mark_recommendations_stale([instance.user_id])
+        result_cache.invalidate([instance.user_id])
@@ -0,0 +1,106 @@
+# core/mail.py
+#
+# Outbox for transactional email. queue_mail() only inserts a row, so request
+# latency no longer includes an SMTP handshake and a slow or failing mail
+# server can't break the view. `manage.py send_queued_mail` drains the outbox
+# with send_due_batch(), one SMTP connection per batch.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+# Give up on a message after this many failed attempts.
+MAX_ATTEMPTS = 6
+# Retry delays double from BASE up to MAX seconds: 30s, 1m, 2m, 4m, 8m.
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+
+def queue_mail(to, subject, body, html_body='', from_email=None):
+    """
+    Adds a message to the outbox. Call it inside the view's transaction so the
+    mail is only sent if the change it announces is committed.
+    """
+    return OutboundEmail.objects.create(
+        to=to,
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try, after `attempts` failures."""
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _record_failure(email, exc, now):
+    email.attempts += 1
+    email.last_error = f"{type(exc).__name__}: {exc}"
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutboundEmail.Status.FAILED
+    else:
+        email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+
+
+def send_due_batch(batch_size=50):
+    """
+    Sends up to `batch_size` due messages over one backend connection.
+    Rows are locked with SKIP LOCKED so several workers can run side by side.
+    Returns (sent, failed) counts for the batch.
+    """
+    now = timezone.now()
+    sent = failed = 0
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.Status.QUEUED, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return 0, 0
+
+        handled = 0
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+            for email in batch:
+                message = EmailMultiAlternatives(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email or None,
+                    to=[email.to],
+                    connection=connection,
+                )
+                if email.html_body:
+                    message.attach_alternative(email.html_body, 'text/html')
+                try:
+                    message.send()
+                except Exception as exc:
+                    _record_failure(email, exc, now)
+                    failed += 1
+                else:
+                    email.attempts += 1
+                    email.status = OutboundEmail.Status.SENT
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+                handled += 1
+        except Exception as exc:
+            # The connection itself failed: everything not yet tried counts as a failed attempt.
+            for email in batch[handled:]:
+                _record_failure(email, exc, now)
+                failed += 1
+        finally:
+            connection.close()
+
+        OutboundEmail.objects.bulk_update(
+            batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+    return sent, failed
@@ -0,0 +1,30 @@
+# core/management/commands/archive_notifications.py
+#
+# Retention for Notification: moves read notifications past the retention
+# age into NotificationArchive so the live table only holds recent and
+# unread rows. Meant to run daily from cron.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.notifications import RETENTION_DAYS, archive_read
+
+
+class Command(BaseCommand):
+    help = 'Archives read notifications older than the retention age.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS,
+                            help=f'Archive read notifications older than this (default {RETENTION_DAYS}).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows moved per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many notifications are due.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days must be >= 0 and --batch-size positive.')
+        archived = archive_read(options['days'], options['batch_size'], options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{archived} notifications are due for archiving.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} notifications."))
@@ -0,0 +1,84 @@
+# core/management/commands/benchmark_search.py
+#
+# Compares alumni search latency for the in-process inverted index against a
+# scan equivalent to the old `icontains` filters, over synthetic populations
+# (default 10k and 100k profiles) built in memory. With --live it also times
+# the configured backend against the real Profile table.
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import InvertedIndex, backend, query_terms, search_profiles
+
+FIRST_NAMES = ['arjun', 'priya', 'rahul', 'sneha', 'vikram', 'anita', 'rohan', 'kavya', 'nikhil', 'meera']
+LAST_NAMES = ['sharma', 'nair', 'menon', 'iyer', 'patel', 'reddy', 'kumar', 'thomas', 'joseph', 'das']
+DEPARTMENTS = ['computer science', 'mechanical engineering', 'civil engineering', 'biotechnology', 'architecture']
+COMPANIES = ['google', 'infosys', 'tcs', 'wipro', 'microsoft', 'amazon', 'ust', 'ibm']
+TITLES = ['software engineer', 'data analyst', 'structural designer', 'research scientist', 'product manager']
+QUERIES = ['priya', 'sha', 'google', 'soft eng', 'rahul infosys', 'civil', 'data ana', 'mic', 'kavya nair', 'zzz']
+
+
+def synthetic_texts(size, rng):
+    texts = []
+    for number in range(size):
+        words = {
+            rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f'user{number}',
+            *rng.choice(DEPARTMENTS).split(), rng.choice(COMPANIES), *rng.choice(TITLES).split(),
+        }
+        texts.append(' '.join(sorted(words)))
+    return texts
+
+
+def scan(texts, terms):
+    """What the old filters did: a substring test of every term on every row."""
+    return [row for row, text in enumerate(texts) if all(term in text for term in terms)]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the alumni search index against a full scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help='Synthetic population sizes to test.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median is reported.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--live', action='store_true',
+                            help='Also time the configured backend on the real Profile table.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or min(options['sizes']) < 1:
+            raise CommandError('--sizes and --repeat must be positive.')
+        rng = random.Random(options['seed'])
+
+        for size in options['sizes']:
+            texts = synthetic_texts(size, rng)
+            started = time.perf_counter()
+            index = InvertedIndex(enumerate(texts))
+            build_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(f"\n{size} profiles (index built in {build_ms:.0f} ms)")
+            self.stdout.write(f"  {'query':<14}{'hits':>8}{'scan ms':>10}{'index ms':>10}")
+            for query in QUERIES:
+                terms = query_terms(query)
+                hits = len(index.search(terms))
+                scan_ms = timed(lambda: scan(texts, terms), options['repeat'])
+                index_ms = timed(lambda: index.search(terms), options['repeat'])
+                self.stdout.write(f"  {query:<14}{hits:>8}{scan_ms:>10.2f}{index_ms:>10.2f}")
+
+        if options['live']:
+            self.stdout.write(f"\nLive table, backend '{backend()}'")
+            for query in QUERIES:
+                terms = query_terms(query)
+                live_ms = timed(lambda: list(search_profiles(terms)[0].values_list('id', flat=True)), options['repeat'])
+                self.stdout.write(f"  {query:<14}{live_ms:>10.2f} ms")
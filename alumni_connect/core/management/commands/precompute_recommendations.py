@@ -0,0 +1,126 @@
+# core/management/commands/precompute_recommendations.py
+#
+# Recomputes RecommendationCache rows for every verified user (or one shard of
+# them) across a pool of worker processes. Run it nightly and after bulk admin
+# verifications, together with RECOMMENDATIONS_PRECOMPUTED = True, so the
+# dashboards never score on the request path.
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Models and the recommender are imported inside the functions below: under
+# the spawn/forkserver start methods a worker re-imports this module to
+# unpickle _score_chunk before _init_worker() has set Django up.
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then not reported.
+    resource = None
+
+# The per-process snapshot, loaded once by _init_worker().
+_snapshot = None
+
+
+def _init_worker(user_ids):
+    global _snapshot
+    # No-op under fork; sets up the app registry under spawn (Windows, macOS).
+    django.setup()
+    from core.recommender import ScoringSnapshot
+
+    _snapshot = ScoringSnapshot(user_ids)
+
+
+def _score_chunk(user_ids):
+    """Scores a chunk of users; returns {user_id: [[profile_id, score], ...]}."""
+    from core.models import Profile
+    from core.recommender import CACHED_RECOMMENDATIONS, rank_profiles
+
+    profiles = Profile.objects.filter(user_id__in=user_ids).select_related('user')
+    return {
+        profile.user_id: [
+            [profile_id, score]
+            for profile_id, score in rank_profiles(profile, snapshot=_snapshot).top(CACHED_RECOMMENDATIONS)
+        ]
+        for profile in profiles
+    }
+
+
+def _peak_memory_mb(who):
+    usage = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+class Command(BaseCommand):
+    help = 'Recomputes cached recommendations for all verified users, or for one shard of them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: one per CPU). 1 runs in this process.')
+        parser.add_argument('--shards', type=int, default=1,
+                            help='Split users into this many shards by user id.')
+        parser.add_argument('--shard', type=int, default=0,
+                            help='Which shard (0-based) this run handles.')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Users scored per task handed to a worker.')
+
+    def handle(self, *args, **options):
+        from core.models import Profile
+
+        workers, shards, shard, chunk_size = (
+            options['workers'], options['shards'], options['shard'], options['chunk_size']
+        )
+        if workers < 1 or chunk_size < 1:
+            raise CommandError('--workers and --chunk-size must be at least 1.')
+        if shards < 1 or not 0 <= shard < shards:
+            raise CommandError('--shard must be between 0 and --shards - 1.')
+
+        user_ids = [
+            user_id for user_id in
+            Profile.objects.filter(is_verified=True).order_by('user_id').values_list('user_id', flat=True)
+            if user_id % shards == shard
+        ]
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+        self.stdout.write(
+            f"Scoring {len(user_ids)} users (shard {shard}/{shards}) in {len(chunks)} chunks "
+            f"with {workers} worker(s)..."
+        )
+
+        started = time.perf_counter()
+        if workers == 1:
+            _init_worker(user_ids)
+            scored = self._store(map(_score_chunk, chunks), len(user_ids), options['verbosity'])
+        else:
+            # Forked workers must not share the parent's database sockets.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(user_ids,)) as pool:
+                scored = self._store(pool.map(_score_chunk, chunks), len(user_ids), options['verbosity'])
+        elapsed = time.perf_counter() - started
+
+        rate = scored / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored recommendations for {scored} users in {elapsed:.1f}s ({rate:.1f} users/sec)."
+        ))
+        if resource is not None:
+            peak = f"Peak memory: {_peak_memory_mb(resource.RUSAGE_SELF):.1f} MB (main process)"
+            if workers > 1:
+                peak += f", {_peak_memory_mb(resource.RUSAGE_CHILDREN):.1f} MB (largest worker)"
+            self.stdout.write(peak + '.')
+
+    def _store(self, results, total, verbosity):
+        """Writes each chunk's results as it arrives; returns the number of users stored."""
+        from core.recommender import store_recommendations
+
+        stored = 0
+        for entries_by_user in results:
+            store_recommendations(entries_by_user)
+            stored += len(entries_by_user)
+            if verbosity >= 2:
+                self.stdout.write(f"  {stored}/{total}")
+        return stored
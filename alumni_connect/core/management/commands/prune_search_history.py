@@ -0,0 +1,40 @@
+# core/management/commands/prune_search_history.py
+#
+# Caps SearchHistory per user. The recommender only reads each user's
+# RECENT_SEARCHES latest searches, so older rows are dead weight. Run it
+# daily from cron.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core.models import SearchHistory
+from core.recommender import RECENT_SEARCHES
+
+
+class Command(BaseCommand):
+    help = "Deletes all but each user's latest searches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=RECENT_SEARCHES,
+                            help=f'Searches kept per user (default {RECENT_SEARCHES}).')
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        if keep < 1:
+            raise CommandError('--keep must be positive.')
+
+        over_limit = (
+            SearchHistory.objects.order_by().values('user_id')
+            .annotate(n=Count('id')).filter(n__gt=keep).values_list('user_id', flat=True)
+        )
+        deleted = users = 0
+        for user_id in over_limit.iterator():
+            history = SearchHistory.objects.filter(user_id=user_id)
+            kept = list(history.order_by('-timestamp', '-id').values_list('id', flat=True)[:keep])
+            removed, _ = history.exclude(id__in=kept).delete()
+            deleted += removed
+            users += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} searches from {users} users, keeping {keep} each."
+        ))
@@ -0,0 +1,52 @@
+# core/management/commands/reconcile_counters.py
+#
+# Recomputes every UserCounters row from the Notification, Connection and
+# messaging tables and fixes any that drifted (e.g. after admin edits or
+# raw SQL, which bypass core.counters).
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.counters import COUNTER_FIELDS, compute_counters
+from core.models import UserCounters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-user badge counters from the source tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only reconcile this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or list(User.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        corrected = 0
+
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            counts = compute_counters(batch)
+            existing = UserCounters.objects.in_bulk(batch)
+
+            drifted, missing = [], []
+            for user_id in batch:
+                values = counts.get(user_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                current = existing.get(user_id)
+                if current is None:
+                    missing.append(UserCounters(user_id=user_id, **values))
+                elif any(getattr(current, field) != values[field] for field in COUNTER_FIELDS):
+                    for field in COUNTER_FIELDS:
+                        setattr(current, field, values[field])
+                    drifted.append(current)
+
+            # Not an upsert: MySQL can't target a conflict column, so existing
+            # rows are updated and missing ones created (ignoring any that a
+            # concurrent request built in the meantime).
+            UserCounters.objects.bulk_update(drifted, COUNTER_FIELDS)
+            UserCounters.objects.bulk_create(missing, ignore_conflicts=True)
+            corrected += len(drifted) + len(missing)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(user_ids)} users; wrote {corrected} counter rows."
+        ))
@@ -0,0 +1,66 @@
+# core/management/commands/send_queued_mail.py
+#
+# Outbox worker: delivers OutboundEmail rows queued by core.mail.queue_mail.
+# Run it as a long-lived process next to the web workers (or with --once from
+# cron). Several copies can run at once; each batch locks its rows.
+
+import asyncio
+import signal
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.mail import send_due_batch
+
+
+class Command(BaseCommand):
+    help = 'Sends queued outbound email in batches, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Messages sent per SMTP connection.')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait when the outbox has nothing due.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain whatever is due now and exit.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['interval'] <= 0:
+            raise CommandError('--batch-size and --interval must be positive.')
+        asyncio.run(self.run(options['batch_size'], options['interval'], options['once']))
+
+    async def run(self, batch_size, interval, once):
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stopping.set)
+            except (NotImplementedError, RuntimeError):  # Windows
+                pass
+
+        total_sent = total_failed = 0
+        while not stopping.is_set():
+            sent, failed = await sync_to_async(self.send_batch, thread_sensitive=True)(batch_size)
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}.")
+            if sent + failed < batch_size:
+                # Nothing more is due right now.
+                if once:
+                    break
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox worker stopped: {total_sent} sent, {total_failed} failed."
+        ))
+
+    @staticmethod
+    def send_batch(batch_size):
+        # Long-running process: drop connections the database has timed out.
+        close_old_connections()
+        return send_due_batch(batch_size)
@@ -1,6 +1,30 @@
 from django.shortcuts import redirect
-from django.urls import resolve, Resolver404
 from django.contrib import messages
+from django.contrib.auth import BACKEND_SESSION_KEY
+
+from .backends import LEGACY_BACKENDS
+
+
+class ProfileMiddleware:
+    """
+    Exposes the logged-in user's Profile as `request.profile` (None for
+    anonymous users and accounts without a profile). The auth backends load
+    it with the user in a single query, so this adds no queries of its own.
+    Must come after AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Sessions created before core.backends existed name the stock
+        # backends; point them at the replacements instead of logging out.
+        legacy_backend = request.session.get(BACKEND_SESSION_KEY)
+        if legacy_backend in LEGACY_BACKENDS:
+            request.session[BACKEND_SESSION_KEY] = LEGACY_BACKENDS[legacy_backend]
+
+        request.profile = getattr(request.user, 'profile', None) if request.user.is_authenticated else None
+        return self.get_response(request)
+
 
 class AccessControlMiddleware:
     """
@@ -21,37 +45,32 @@ class AccessControlMiddleware:
         ]
 
     def __call__(self, request):
-        # Allow all requests to proceed initially
-        response = self.get_response(request)
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Runs after URL resolution but before the view, so a blocked request
+        # never executes the restricted view. Returning None lets it through.
+        # The URL name check comes first; it costs nothing for most pages.
+        if request.resolver_match.url_name not in self.RESTRICTED_URL_NAMES:
+            return None
 
         # Only run checks for logged-in users who are not administrators
         if not request.user.is_authenticated or request.user.is_staff:
-            return response
-
-        # Check if the user's profile is verified
-        try:
-            is_verified = request.user.profile.is_verified
-        except AttributeError:
-            # This handles the rare case where a user has no profile
-            # In this scenario, we treat them as unverified
-            is_verified = False
-
-        # If the user is not verified, check if they are trying to access a restricted page
-        if not is_verified:
-            try:
-                current_url_name = resolve(request.path_info).url_name
-            except Resolver404:
-                current_url_name = None
-
-            if current_url_name in self.RESTRICTED_URL_NAMES:
-                # User is unverified and trying to access a restricted page.
-                # Send a warning message.
-                messages.warning(request, 'You must be a verified user to access this page.')
-                
-                # Redirect them to their correct dashboard.
-                if request.user.profile.user_type == 'student':
-                    return redirect('core:student_dashboard')
-                else:
-                    return redirect('core:alumni_dashboard')
-        
-        return response
\ No newline at end of file
+            return None
+
+        # Check if the user's profile is verified. A user without a profile
+        # (request.profile is None) is treated as unverified.
+        profile = request.profile
+
+        if profile is None or not profile.is_verified:
+            # User is unverified and trying to access a restricted page.
+            # Send a warning message.
+            messages.warning(request, 'You must be a verified user to access this page.')
+
+            # Redirect them to their correct dashboard.
+            if profile is not None and profile.user_type == 'student':
+                return redirect('core:student_dashboard')
+            else:
+                return redirect('core:alumni_dashboard')
+
+        return None
@@ -0,0 +1,49 @@
+import re
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def populate_tokens(apps, schema_editor):
+    Profile = apps.get_model('core', 'Profile')
+
+    def serialize(text):
+        return ' '.join(sorted(set(re.findall(r'\b\w+\b', text.lower())))) if text else ''
+
+    batch = []
+    for profile in Profile.objects.only('id', 'bio', 'job_title').iterator(chunk_size=1000):
+        profile.bio_tokens = serialize(profile.bio)
+        profile.job_title_tokens = serialize(profile.job_title)
+        batch.append(profile)
+        if len(batch) >= 1000:
+            Profile.objects.bulk_update(batch, ['bio_tokens', 'job_title_tokens'])
+            batch = []
+    if batch:
+        Profile.objects.bulk_update(batch, ['bio_tokens', 'job_title_tokens'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_recommendationcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='bio_tokens',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='job_title_tokens',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_tokens, migrations.RunPython.noop),
+    ]
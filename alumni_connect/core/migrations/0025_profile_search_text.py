@@ -0,0 +1,58 @@
+import re
+
+from django.db import migrations, models
+
+SEARCH_TEXT_FIELDS = (
+    'full_name', 'department', 'company_name', 'job_title',
+    'past_job_title', 'past_company_name', 'bio',
+)
+
+
+def populate_search_text(apps, schema_editor):
+    Profile = apps.get_model('core', 'Profile')
+
+    def words(text):
+        return re.findall(r'\b\w+\b', text.lower()) if text else []
+
+    batch = []
+    profiles = Profile.objects.select_related('user').only('id', 'user__username', *SEARCH_TEXT_FIELDS)
+    for profile in profiles.iterator(chunk_size=1000):
+        tokens = set(words(profile.user.username))
+        for field in SEARCH_TEXT_FIELDS:
+            tokens.update(words(getattr(profile, field)))
+        profile.search_text = ' '.join(sorted(tokens))
+        batch.append(profile)
+        if len(batch) >= 1000:
+            Profile.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Profile.objects.bulk_update(batch, ['search_text'])
+
+
+def add_fulltext_index(apps, schema_editor):
+    # Only MySQL gets a FULLTEXT index; other databases use the in-process
+    # index in core/search.py.
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('CREATE FULLTEXT INDEX profile_search_ft ON core_profile (search_text)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX profile_search_ft ON core_profile')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_notification_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
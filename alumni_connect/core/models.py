@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models import DEFERRED
 from django.contrib.auth.models import User
 from django.db.models import Q
 from django.utils import timezone
+from .tokens import SEARCH_TEXT_FIELDS, search_text, serialize_tokens, tokenize
 
 
 class Profile(models.Model):
@@ -49,9 +51,69 @@ class Profile(models.Model):
         default=True, 
         help_text="Send an email when someone accepts your connection request."
     )
+
+    # Denormalized word tokens of bio / job_title used by the recommender,
+    # stored space-separated and refreshed on every save.
+    bio_tokens = models.TextField(blank=True, default='')
+    job_title_tokens = models.TextField(blank=True, default='')
+    # Words of the name, username, department, companies, job titles and bio
+    # for core.search; carries a FULLTEXT index on MySQL.
+    search_text = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # The candidate set of every ranking and search: verified alumni.
+            models.Index(fields=['user_type', 'is_verified'], name='profile_type_verified_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username} Profile'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the row held when loaded, so post_save handlers can tell which
+        # fields a save actually changed (see changed_fields()).
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if value is not DEFERRED
+        }
+        return instance
+
+    def changed_fields(self):
+        """
+        Names of the fields whose value differs from the one loaded from (or
+        last saved to) the database; None for an instance that wasn't loaded,
+        where any field may have changed.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return {
+            field.name for field in self._meta.concrete_fields
+            if field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname)
+        }
+
+    def save(self, *args, **kwargs):
+        self.bio_tokens = serialize_tokens(tokenize(self.bio))
+        self.job_title_tokens = serialize_tokens(tokenize(self.job_title))
+        self.search_text = search_text(self, self.user.username if self.user_id else '')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'bio', 'job_title'}.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'bio_tokens', 'job_title_tokens', 'updated_at'}
+        if update_fields is not None and set(SEARCH_TEXT_FIELDS).intersection(update_fields):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_text', 'updated_at'}
+        super().save(*args, **kwargs)
+        # The post_save handlers have compared against the old values; the
+        # saved ones are what the row holds now.
+        saved = kwargs.get('update_fields')
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{
+                field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+                if saved is None or field.name in saved or field.attname in saved
+            },
+        }
     
     def is_online(self):
         """Returns True if the user was last seen within the last 5 minutes."""
@@ -92,6 +154,11 @@ class Connection(models.Model):
         # Ensures a user can't send multiple requests to the same person
         unique_together = ('sender', 'receiver')
         ordering = ['-created_at']
+        indexes = [
+            # Pending requests for a receiver, accepted connections from either side.
+            models.Index(fields=['receiver', 'status'], name='connection_receiver_status_idx'),
+            models.Index(fields=['sender', 'status'], name='connection_sender_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} -> {self.receiver.username} ({self.get_status_display()})"
@@ -120,9 +187,35 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The notifications page and unread counts, newest first, per user.
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}: {self.actor.username} {self.verb}"
+
+
+class NotificationArchive(models.Model):
+    """
+    Read notifications moved out of Notification by `manage.py
+    archive_notifications` once they pass the retention age. Kept narrow:
+    the actor is a plain id, so archived rows don't pin or join User.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    actor_id = models.IntegerField(null=True, blank=True)
+    verb = models.CharField(max_length=255)
+    link = models.URLField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'created_at'], name='notif_archive_recipient_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived notification for user {self.recipient_id}: {self.verb}"
     
 class SearchHistory(models.Model):
     """Stores a record of a user's search queries on the find_alumni page."""
@@ -131,12 +224,82 @@ class SearchHistory(models.Model):
     department = models.CharField(max_length=100, blank=True, null=True)
     graduation_year = models.CharField(max_length=4, blank=True, null=True)
     company = models.CharField(max_length=100, blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the search happens, not when core.search_history writes the row.
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # A user's latest searches, read by the recommender.
+            models.Index(fields=['user', 'timestamp'], name='searchhistory_user_time_idx'),
+        ]
 
     def __str__(self):
         query_parts = [self.name, self.department, self.company, self.graduation_year]
         query = ', '.join(filter(None, query_parts)) or "Empty search"
-        return f"Search by {self.user.username}: '{query}'"    
\ No newline at end of file
+        return f"Search by {self.user.username}: '{query}'"    
+
+class RecommendationCache(models.Model):
+    """
+    Materialized top-N recommendations for a single user.
+    Dashboards read this ranked list instead of rescoring every alumnus on
+    each request. Rows are marked stale by core.handlers and rebuilt lazily.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation_cache')
+    # Ranked list of [profile_id, score] pairs, best match first.
+    entries = models.JSONField(default=list)
+    is_stale = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Recommendations for {self.user.username} ({len(self.entries)} entries)"
+
+
+class UserCounters(models.Model):
+    """
+    Denormalized badge counts for one user, read by global_context with a
+    single primary-key lookup. Kept in step by the write paths through
+    core.counters; `manage.py reconcile_counters` rebuilds them from source.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    # Signed on purpose: decrements are clamped with Greatest(), and MySQL
+    # rejects an unsigned column going below zero before the clamp applies.
+    unread_notifications = models.IntegerField(default=0)
+    pending_requests = models.IntegerField(default=0)
+    unread_conversations = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Counters for {self.user.username}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Durable outbox row for one email. Views queue mail with core.mail.queue_mail
+    inside their transaction; `manage.py send_queued_mail` delivers it, retrying
+    failures with exponential backoff.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    to = models.EmailField()
+    from_email = models.CharField(max_length=254, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "what is due" scan.
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.get_status_display()})"
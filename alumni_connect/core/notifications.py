@@ -0,0 +1,142 @@
+# core/notifications.py
+#
+# Creating notifications. notify() writes any number of them with one
+# bulk_create, bumps the recipients' unread badge in bulk and, once the
+# transaction commits, pushes a small `notification_created` event to each
+# recipient's `user_{id}` group so an open page can update without a reload.
+# The push is best-effort: if the channel layer is down the error is logged
+# and the request still succeeds, since the rows and counters are already
+# committed.
+#
+# Reading and retention: notification_page() pages a user's list by keyset
+# rather than OFFSET/COUNT, and archive_read() moves old read rows into
+# NotificationArchive (`manage.py archive_notifications`).
+
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from messaging.utils import decode_cursor, encode_cursor
+
+from . import counters
+from .models import Notification, NotificationArchive
+
+NOTIFICATION_PAGE_SIZE = 15
+# Read notifications older than this many days are archived by default.
+RETENTION_DAYS = 90
+
+
+def _actor_name(actor):
+    if actor is None:
+        return None
+    profile = getattr(actor, 'profile', None)
+    return (profile.full_name if profile else '') or actor.username
+
+
+def notify(entries):
+    """
+    Creates a notification for every (recipient, actor, verb, link) entry.
+    `recipient` may be a User or a user id, `actor` a User or None, `link`
+    a URL or None. Returns the created Notification objects.
+    """
+    notifications = [
+        Notification(
+            recipient_id=getattr(recipient, 'pk', recipient),
+            actor=actor,
+            verb=verb,
+            link=link,
+        )
+        for recipient, actor, verb, link in entries
+    ]
+    if not notifications:
+        return []
+
+    Notification.objects.bulk_create(notifications, batch_size=1000)
+    per_recipient = Counter(n.recipient_id for n in notifications)
+    counters.adjust_many('unread_notifications', per_recipient)
+
+    # One event per recipient, describing the newest of their notifications.
+    latest = {n.recipient_id: n for n in notifications}
+    events = {
+        recipient_id: {
+            'type': 'notification_created',
+            'count': per_recipient[recipient_id],
+            'actor': _actor_name(n.actor),
+            'verb': n.verb,
+            'link': n.link,
+        }
+        for recipient_id, n in latest.items()
+    }
+    transaction.on_commit(lambda: _push(events), robust=True)
+    return notifications
+
+
+def _push(events):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    send = async_to_sync(channel_layer.group_send)
+    for recipient_id, event in events.items():
+        send(f'user_{recipient_id}', event)
+
+
+def notification_page(user, before=None, limit=NOTIFICATION_PAGE_SIZE):
+    """
+    One page of the user's notifications, newest first: the `limit` newest
+    strictly older than the `before` cursor (see messaging.utils.encode_cursor).
+    Returns (notifications, cursor for the next page or None). Seeks on
+    notification_inbox_idx and never counts the user's whole history.
+    """
+    notifications = Notification.objects.filter(recipient=user).select_related('actor__profile')
+    if before is not None:
+        created_at, notification_id = decode_cursor(before)
+        notifications = notifications.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=notification_id)
+        )
+    page = list(notifications.order_by('-created_at', '-id')[:limit + 1])
+    older = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], older
+
+
+def archive_read(older_than_days=RETENTION_DAYS, batch_size=1000, dry_run=False):
+    """
+    Moves read notifications created more than `older_than_days` ago into
+    NotificationArchive, `batch_size` rows per transaction, oldest first.
+    Rows are locked with SKIP LOCKED, so overlapping runs don't copy twice.
+    Unread rows are never touched, so badge counters stay valid.
+    Returns the number of notifications archived (or that would be).
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    due = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+    if dry_run:
+        return due.count()
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                due.select_for_update(skip_locked=True).order_by('created_at', 'id')
+                .values('id', 'recipient_id', 'actor_id', 'verb', 'link', 'created_at')[:batch_size]
+            )
+            if not batch:
+                break
+            NotificationArchive.objects.bulk_create([
+                NotificationArchive(
+                    recipient_id=row['recipient_id'],
+                    actor_id=row['actor_id'],
+                    verb=row['verb'],
+                    link=row['link'],
+                    created_at=row['created_at'],
+                )
+                for row in batch
+            ])
+            Notification.objects.filter(pk__in=[row['id'] for row in batch]).delete()
+        archived += len(batch)
+        if len(batch) < batch_size:
+            break
+    return archived
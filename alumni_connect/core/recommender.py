@@ -1,9 +1,37 @@
 # core/recommender.py
 
-from .models import Profile, Connection, SearchHistory
-from django.db.models import Q
-import re
+from .models import Profile, SearchHistory, RecommendationCache
+from .tokens import profile_tokens
+from . import graph
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
 from collections import Counter
+from operator import itemgetter
+import heapq
+
+# How many ranked entries are materialized per user in RecommendationCache.
+CACHED_RECOMMENDATIONS = 50
+
+# Cached rows older than this are treated as stale even if nothing marked them.
+RECOMMENDATION_CACHE_TTL = timedelta(hours=24)
+
+# How many of a user's latest searches personalize their scores; older
+# SearchHistory rows are pruned by `manage.py prune_search_history`.
+RECENT_SEARCHES = 10
+
+# Profile fields that feed into the score. Saves touching only other fields
+# (e.g. last_seen) don't invalidate anybody's cached recommendations.
+SCORING_FIELDS = frozenset({'user_type', 'is_verified', 'department', 'company_name', 'job_title', 'bio'})
+
+# Ids per query when ScoringSnapshot loads searches and adjacency rows.
+SNAPSHOT_BATCH_SIZE = 1000
+
+# The columns the scoring loop reads from each candidate Profile.
+SCORING_COLUMNS = (
+    'id', 'user_id', 'department', 'company_name', 'job_title', 'bio',
+    'bio_tokens', 'job_title_tokens', 'updated_at',
+)
 
 # A comprehensive dictionary of keywords relevant to each department.
 # This is the "knowledge base" for the AI.
@@ -63,7 +91,165 @@ DEPARTMENT_KEYWORDS = {
 }
 
 
-def get_recommendations(profile_to_recommend_for, base_queryset=None):
+def get_personalization_data(current_user, snapshot=None):
+    """
+    Collects the behavioral and collaborative signals used to personalize
+    scores for a user. Shared by the pure-Python and vectorized scorers.
+    With a ScoringSnapshot, profile fields and searches are read from memory.
+    """
+    # Get IDs of people the user is already connected to (Level 1 connections)
+    level1_connection_ids = graph.neighbors(current_user.id)
+
+    # --- NEW: LinkedIn-style "Friends-of-Friends" Logic ---
+    # Who the user's connections are connected to (Level 2 connections),
+    # counted by mutual connections, read from the cached adjacency sets.
+    level2_profile_ids = graph.second_degree_counts(current_user.id)
+
+    if snapshot is None:
+        connected_profiles = Profile.objects.filter(
+            user_id__in=level1_connection_ids
+        ).values_list('department', 'company_name')
+        from . import search_history
+
+        # Includes searches still waiting in this process's write buffer.
+        recent_searches = search_history.recent_searches(current_user, RECENT_SEARCHES)
+    else:
+        connected_profiles = [
+            snapshot.profile_fields[user_id] for user_id in level1_connection_ids
+            if user_id in snapshot.profile_fields
+        ]
+        recent_searches = snapshot.recent_searches.get(current_user.id, [])
+
+    # Analyze connections to find preferred departments and companies
+    connected_departments = Counter(department for department, _ in connected_profiles)
+    connected_companies = Counter(company for _, company in connected_profiles if company)
+
+    # Analyze search history
+    searched_departments = Counter(department for department, _ in recent_searches if department)
+    searched_companies = Counter(company for _, company in recent_searches if company)
+
+    return {
+        'level1_connection_ids': level1_connection_ids,
+        'level2_profile_ids': level2_profile_ids,
+        'connected_departments': connected_departments,
+        'connected_companies': connected_companies,
+        'searched_departments': searched_departments,
+        'searched_companies': searched_companies,
+    }
+
+
+class ScoringSnapshot:
+    """
+    Everything the scorers read from the database, loaded up front, for batch
+    jobs that score many users in a row (see precompute_recommendations).
+    Scoring with a snapshot issues no queries apart from the graph warm-up.
+    """
+    def __init__(self, user_ids=None):
+        # The default candidate set, in the order the live query returns it.
+        self.candidates = list(
+            Profile.objects.filter(user_type='alumni', is_verified=True).order_by('id').only(*SCORING_COLUMNS)
+        )
+        self.profile_fields = {
+            user_id: (department, company_name)
+            for user_id, department, company_name
+            in Profile.objects.values_list('user_id', 'department', 'company_name')
+        }
+
+        searches = SearchHistory.objects.order_by('user_id', '-timestamp').values_list('user_id', 'department', 'company')
+        if user_ids is None:
+            batches = [searches]
+        else:
+            user_ids = list(user_ids)
+            batches = [
+                searches.filter(user_id__in=user_ids[start:start + SNAPSHOT_BATCH_SIZE])
+                for start in range(0, len(user_ids), SNAPSHOT_BATCH_SIZE)
+            ]
+        self.recent_searches = {}
+        for batch in batches:
+            for user_id, department, company in batch:
+                recent = self.recent_searches.setdefault(user_id, [])
+                if len(recent) < RECENT_SEARCHES:
+                    recent.append((department, company))
+
+        # Loads every adjacency row the scorers can touch, one query per batch.
+        all_user_ids = list(self.profile_fields)
+        for start in range(0, len(all_user_ids), SNAPSHOT_BATCH_SIZE):
+            graph.neighbors_many(all_user_ids[start:start + SNAPSHOT_BATCH_SIZE])
+
+
+class RankedProfiles:
+    """
+    A lazily ranked, sliceable sequence of alumni Profiles, usable directly
+    as a Paginator object_list.
+
+    Only (profile_id, score) pairs are kept. Asking for the first K entries
+    selects them with a bounded top-K (a heap for the Python scorer), and
+    slicing hydrates full Profile rows only for the slice being rendered.
+    Equal scores keep their candidate order, as a stable sort would.
+    """
+    def __init__(self, count, select_top):
+        self._count = count
+        self._select_top = select_top
+        self._top = []
+
+    @classmethod
+    def from_scores(cls, scored_profiles):
+        return cls(
+            len(scored_profiles),
+            lambda k: heapq.nlargest(k, scored_profiles, key=itemgetter(1)),
+        )
+
+    def __len__(self):
+        return self._count
+
+    def top(self, k=None):
+        """Returns the best k (profile_id, score) pairs, highest score first."""
+        k = self._count if k is None else min(k, self._count)
+        if k > len(self._top):
+            self._top = self._select_top(k)
+        return self._top[:k]
+
+    def recommendations(self, limit=None):
+        """The top entries in get_recommendations() format."""
+        return self._hydrate(self.top(limit))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            entries = self.top(stop)[start:stop:step]
+            return [rec['profile'] for rec in self._hydrate(entries)]
+        return self[index:index + 1][0]
+
+    def _hydrate(self, entries):
+        # The NumPy engine ranks from a snapshot up to SNAPSHOT_MAX_AGE old, so
+        # drop anyone unverified since; the Python engine never ranks them.
+        profiles = Profile.objects.select_related('user').filter(is_verified=True).in_bulk(
+            [profile_id for profile_id, _ in entries]
+        )
+        return [
+            {'profile': profiles[profile_id], 'score': score}
+            for profile_id, score in entries
+            if profile_id in profiles
+        ]
+
+
+def rank_profiles(profile_to_recommend_for, base_queryset=None, snapshot=None, relevance=None):
+    """
+    Scores candidates for a profile and returns them as RankedProfiles.
+    `relevance` ({profile_id: score} from core.search) is added to the
+    recommender score, SEARCH_RELEVANCE_WEIGHT points per unit.
+
+    Set RECOMMENDER_ENGINE = 'numpy' in settings to score with the vectorized
+    engine in core.vector_recommender; the rankings are identical.
+    """
+    if getattr(settings, 'RECOMMENDER_ENGINE', 'python') == 'numpy':
+        from . import vector_recommender
+        if vector_recommender.is_available():
+            return vector_recommender.rank_profiles(profile_to_recommend_for, base_queryset, snapshot, relevance)
+    return score_profiles(profile_to_recommend_for, base_queryset, snapshot, relevance)
+
+
+def get_recommendations(profile_to_recommend_for, base_queryset=None, limit=None):
     """
     Generates a scored and sorted list of recommendations for any given profile.
     This is a Hybrid Recommender using:
@@ -71,56 +257,44 @@ def get_recommendations(profile_to_recommend_for, base_queryset=None):
     2. Behavioral Personalization (search history)
     3. Collaborative Filtering (connections of connections - "friends-of-friends")
     """
-    
+    return rank_profiles(profile_to_recommend_for, base_queryset).recommendations(limit)
+
+
+def score_profiles(profile_to_recommend_for, base_queryset=None, snapshot=None, relevance=None):
+    """The reference pure-Python scorer behind rank_profiles()."""
+    from .search import SEARCH_RELEVANCE_WEIGHT
+
     is_searching = base_queryset is not None
+    relevance = relevance or {}
     current_user = profile_to_recommend_for.user
 
     # --- 1. GATHER DATA FOR PERSONALIZATION ---
-    
-    # Get IDs of people the user is already connected to (Level 1 connections)
-    user_connections_qs = Connection.objects.filter(
-        (Q(sender=current_user) | Q(receiver=current_user)),
-        status=Connection.Status.ACCEPTED
-    )
-    level1_connection_ids = {
-        conn.sender_id if conn.receiver == current_user else conn.receiver_id 
-        for conn in user_connections_qs
-    }
-    
-    # --- NEW: LinkedIn-style "Friends-of-Friends" Logic ---
-    # Find who the user's connections are connected to (Level 2 connections)
-    level2_connections_qs = Connection.objects.filter(
-        (Q(sender_id__in=level1_connection_ids) | Q(receiver_id__in=level1_connection_ids)),
-        status=Connection.Status.ACCEPTED
-    )
-    level2_profile_ids = Counter()
-    for conn in level2_connections_qs:
-        friend_of_friend_id = conn.sender_id if conn.receiver_id in level1_connection_ids else conn.receiver_id
-        # Exclude the user themselves and their direct connections
-        if friend_of_friend_id != current_user.id and friend_of_friend_id not in level1_connection_ids:
-            level2_profile_ids[friend_of_friend_id] += 1 # Count mutual connections
-
-    # Analyze connections to find preferred departments and companies
-    connected_profiles = Profile.objects.filter(user_id__in=level1_connection_ids)
-    connected_departments = Counter(p.department for p in connected_profiles)
-    connected_companies = Counter(p.company_name for p in connected_profiles if p.company_name)
-
-    # Analyze search history
-    recent_searches = current_user.search_history.all()[:10]
-    searched_departments = Counter(s.department for s in recent_searches if s.department)
-    searched_companies = Counter(s.company for s in recent_searches if s.company)
+    data = get_personalization_data(current_user, snapshot)
+    level1_connection_ids = data['level1_connection_ids']
+    level2_profile_ids = data['level2_profile_ids']
+    connected_departments = data['connected_departments']
+    connected_companies = data['connected_companies']
+    searched_departments = data['searched_departments']
+    searched_companies = data['searched_companies']
 
     # --- 2. GET THE ALUMNI TO SCORE ---
     if is_searching:
-        profiles_to_score = base_queryset
+        profiles_to_score = base_queryset.only(*SCORING_COLUMNS)
+    elif snapshot is not None:
+        profiles_to_score = [
+            target_profile for target_profile in snapshot.candidates
+            if target_profile.user_id != current_user.id and target_profile.user_id not in level1_connection_ids
+        ]
     else:
         # By default, don't recommend people the user is already connected to
         profiles_to_score = Profile.objects.filter(user_type='alumni', is_verified=True).exclude(user=current_user).exclude(user_id__in=level1_connection_ids)
+        # Only load what scoring reads; full rows are hydrated for the results shown.
+        profiles_to_score = profiles_to_score.only(*SCORING_COLUMNS)
     
     # --- 3. SCORE EACH ALUMNUS ---
     user_department = (profile_to_recommend_for.department or "").strip().lower()
     user_company = (profile_to_recommend_for.company_name or "").strip().lower()
-    user_bio_words = set(re.findall(r'\b\w+\b', profile_to_recommend_for.bio.lower())) if profile_to_recommend_for.bio else set()
+    user_bio_words, _ = profile_tokens(profile_to_recommend_for)
     user_dept_keywords = set(DEPARTMENT_KEYWORDS.get(profile_to_recommend_for.department, []))
             
     scored_profiles = []
@@ -130,17 +304,16 @@ def get_recommendations(profile_to_recommend_for, base_queryset=None):
         # --- A. CONTENT-BASED SCORING ---
         target_department = (target_profile.department or "").strip().lower()
         target_company = (target_profile.company_name or "").strip().lower()
-        target_bio_words = set(re.findall(r'\b\w+\b', target_profile.bio.lower())) if target_profile.bio else set()
+        # Token sets come from the stored columns via an LRU, never re-tokenized.
+        target_bio_words, job_words = profile_tokens(target_profile)
 
         if profile_to_recommend_for.user_type == 'student':
             if target_department and user_department and target_department == user_department: score += 50
             if user_dept_keywords and target_profile.job_title:
-                job_words = set(re.findall(r'\b\w+\b', target_profile.job_title.lower()))
                 score += len(user_dept_keywords.intersection(job_words)) * 15
         else: # User is an Alumnus
             if target_company and user_company and target_company == user_company: score += 40
             if user_dept_keywords and target_profile.job_title:
-                job_words = set(re.findall(r'\b\w+\b', target_profile.job_title.lower()))
                 score += len(user_dept_keywords.intersection(job_words)) * 20
             if target_department and user_department and target_department == user_department: score += 15
 
@@ -157,13 +330,90 @@ def get_recommendations(profile_to_recommend_for, base_queryset=None):
             
         # Add a major score boost for "friends of friends"
         # Each mutual connection gives 30 points.
-        score += level2_profile_ids.get(target_profile.user.id, 0) * 30
+        score += level2_profile_ids.get(target_profile.user_id, 0) * 30
+
+        # --- C. SEARCH RELEVANCE ---
+        score += relevance.get(target_profile.id, 0) * SEARCH_RELEVANCE_WEIGHT
 
         if is_searching:
-            scored_profiles.append({'profile': target_profile, 'score': score})
+            scored_profiles.append((target_profile.id, score))
         elif score > 0:
-            scored_profiles.append({'profile': target_profile, 'score': score})
+            scored_profiles.append((target_profile.id, score))
             
-    # --- 4. SORT AND RETURN ---
-    sorted_profiles = sorted(scored_profiles, key=lambda x: x['score'], reverse=True)
-    return sorted_profiles
\ No newline at end of file
+    # --- 4. RANK LAZILY; ONLY THE REQUESTED TOP-K IS EVER SORTED ---
+    return RankedProfiles.from_scores(scored_profiles)
+
+
+def refresh_recommendations(profile_to_recommend_for):
+    """
+    Runs the live scorer for a profile and stores its top entries in
+    RecommendationCache. Returns the freshly scored entries.
+    """
+    recommendations = get_recommendations(profile_to_recommend_for, limit=CACHED_RECOMMENDATIONS)
+    entries = [[rec['profile'].id, rec['score']] for rec in recommendations]
+    RecommendationCache.objects.update_or_create(
+        user_id=profile_to_recommend_for.user_id,
+        defaults={'entries': entries, 'is_stale': False},
+    )
+    return recommendations
+
+
+def store_recommendations(entries_by_user, batch_size=500):
+    """
+    Bulk-writes {user_id: [[profile_id, score], ...]} into RecommendationCache,
+    updating existing rows and creating the rest.
+    """
+    now = timezone.now()
+    existing = RecommendationCache.objects.in_bulk(list(entries_by_user), field_name='user_id')
+    to_update, to_create = [], []
+    for user_id, entries in entries_by_user.items():
+        cache_row = existing.get(user_id)
+        if cache_row is None:
+            to_create.append(RecommendationCache(user_id=user_id, entries=entries, is_stale=False))
+        else:
+            # bulk_update() skips auto_now, so stamp computed_at by hand.
+            cache_row.entries, cache_row.is_stale, cache_row.computed_at = entries, False, now
+            to_update.append(cache_row)
+    RecommendationCache.objects.bulk_update(to_update, ['entries', 'is_stale', 'computed_at'], batch_size=batch_size)
+    # A request may have created the row meanwhile; its entries are just as fresh.
+    RecommendationCache.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+
+
+def get_cached_recommendations(profile_to_recommend_for, limit=5):
+    """
+    Returns the top `limit` recommendations in the same shape as
+    get_recommendations(), read from the materialized cache.
+    Falls back to the live scorer when the cached row is missing or stale.
+    """
+    cache_row = RecommendationCache.objects.filter(user_id=profile_to_recommend_for.user_id).first()
+    if cache_row is None or limit > CACHED_RECOMMENDATIONS:
+        is_expired = True
+    elif getattr(settings, 'RECOMMENDATIONS_PRECOMPUTED', False):
+        # precompute_recommendations refreshes rows in batch; serve them as they are.
+        is_expired = False
+    else:
+        is_expired = (
+            cache_row.is_stale
+            or cache_row.computed_at < timezone.now() - RECOMMENDATION_CACHE_TTL
+        )
+    if is_expired:
+        return refresh_recommendations(profile_to_recommend_for)[:limit]
+
+    top_entries = cache_row.entries[:limit]
+    # A profile may have been unverified since the row was computed; skip those.
+    profiles = Profile.objects.filter(
+        user_type='alumni', is_verified=True
+    ).select_related('user').filter(is_verified=True).in_bulk([profile_id for profile_id, _ in top_entries])
+    return [
+        {'profile': profiles[profile_id], 'score': score}
+        for profile_id, score in top_entries
+        if profile_id in profiles
+    ]
+
+
+def mark_recommendations_stale(user_ids=None):
+    """Flags cached rows for the given users (or everyone) for recomputation."""
+    cache_rows = RecommendationCache.objects.filter(is_stale=False)
+    if user_ids is not None:
+        cache_rows = cache_rows.filter(user_id__in=user_ids)
+    cache_rows.update(is_stale=True)
@@ -0,0 +1,91 @@
+# core/result_cache.py
+#
+# Per-user cache of find_alumni rankings. The first request for a query
+# scores as usual and stores the top RESULT_CACHE_SIZE (profile_id, score)
+# pairs plus the total count; later pages of the same query are sliced from
+# that list without touching the scorer.
+#
+# Entries are never deleted. Keys embed two generation counters instead:
+# the user's own (bumped when their connections, search history or profile
+# change) and a global one (bumped when any alumnus changes, since an edit
+# or verification can move a profile into or out of anybody's results).
+# Bumping a generation makes every key built from the old one unreachable.
+
+import hashlib
+
+from django.core.cache import cache
+
+from .recommender import RankedProfiles
+
+# Ranked entries kept per query: enough for 50 pages of 9.
+RESULT_CACHE_SIZE = 450
+RESULT_CACHE_TTL = 600
+
+GLOBAL_GENERATION_KEY = 'find_alumni:generation'
+USER_GENERATION_KEY = 'find_alumni:generation:{}'
+RESULT_KEY = 'find_alumni:results:{}:{}:{}:{}'
+
+
+def normalize_query(name='', department='', graduation_year='', company=''):
+    """The search inputs as compared for caching: trimmed, lowercase, single-spaced."""
+    return tuple(' '.join((value or '').lower().split()) for value in (name, department, graduation_year, company))
+
+
+def _key(user_id, query):
+    generations = cache.get_many([GLOBAL_GENERATION_KEY, USER_GENERATION_KEY.format(user_id)])
+    digest = hashlib.sha1('\x1f'.join(query).encode()).hexdigest()
+    return RESULT_KEY.format(
+        user_id,
+        generations.get(GLOBAL_GENERATION_KEY, 0),
+        generations.get(USER_GENERATION_KEY.format(user_id), 0),
+        digest,
+    )
+
+
+def cached_ranking(user_id, query, rank):
+    """
+    RankedProfiles for the query, from the cache when possible. `rank` is
+    called only on a miss and must return RankedProfiles. Returns
+    (ranking, hit) where `hit` says whether scoring was skipped.
+    """
+    key = _key(user_id, query)
+    entry = cache.get(key)
+    if entry is not None:
+        count, top = entry
+        return CachedRanking(count, top, rank), True
+
+    ranking = rank()
+    cache.set(key, (len(ranking), ranking.top(RESULT_CACHE_SIZE)), RESULT_CACHE_TTL)
+    return ranking, False
+
+
+class CachedRanking(RankedProfiles):
+    """
+    RankedProfiles over a cached top list. Asking for more entries than were
+    cached (a page past RESULT_CACHE_SIZE) falls back to scoring live.
+    """
+    def __init__(self, count, top, rank):
+        super().__init__(count, self._select_cached)
+        self._cached = top
+        self._rank = rank
+
+    def _select_cached(self, k):
+        if k <= len(self._cached):
+            return self._cached[:k]
+        return self._rank().top(k)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate(user_ids=None):
+    """Drops cached results for the given users, or for everyone."""
+    if user_ids is None:
+        _bump(GLOBAL_GENERATION_KEY)
+        return
+    for user_id in user_ids:
+        _bump(USER_GENERATION_KEY.format(user_id))
@@ -0,0 +1,318 @@
+# core/search.py
+#
+# Word search over Profile.search_text for find_alumni, replacing chained
+# icontains filters (leading-wildcard LIKE scans that no index can serve).
+#
+# Two backends, chosen by PROFILE_SEARCH_BACKEND:
+#   'mysql'  - MATCH ... AGAINST on the profile_search_ft FULLTEXT index, in
+#              boolean mode with every term required as a prefix (`+term*`).
+#   'memory' - an inverted index held in each process: postings per word plus
+#              a sorted vocabulary, so a prefix is found with bisect. Kept up
+#              to date on Profile save/delete and rebuilt when another process
+#              bumps the shared version (same scheme as the recommender's
+#              ProfileMatrix). Rebuilds run on a background thread while
+#              requests keep searching the old index.
+# 'auto' (the default) picks 'mysql' on MySQL and 'memory' everywhere else.
+#
+# Both return a relevance score per profile that rank_profiles() blends into
+# the recommender score, weighted by SEARCH_RELEVANCE_WEIGHT.
+#
+# search_text mixes every field (bio and job titles included), so the index
+# only narrows the candidates. find_alumni passes its inputs per field, and
+# the candidates are then checked in Python: each input's words must also
+# start a word of that field's own columns, so "civil" in Department doesn't
+# match a bio mentioning civil services. On MySQL, a query made only of
+# terms too short for the FULLTEXT index is narrowed with istartswith on the
+# field instead (so those match the start of the value, not of any word).
+
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Profile
+from .tokens import TOKEN_PATTERN
+
+# Bumped in the shared cache when profiles change, so every process rebuilds.
+INDEX_VERSION_KEY = 'search:index_version'
+# How long a process keeps its index when the cache isn't shared.
+INDEX_MAX_AGE = 300
+# Recommender points per unit of search relevance.
+SEARCH_RELEVANCE_WEIGHT = 10
+# A prefix match counts this much of an exact word match.
+PREFIX_MATCH_WEIGHT = 0.5
+# InnoDB's default innodb_ft_min_token_size; shorter terms aren't in the index.
+MYSQL_MIN_TOKEN_SIZE = 3
+
+# find_alumni input -> the Profile columns it searches.
+FIELD_COLUMNS = {
+    'name': ('full_name', 'user__username'),
+    'department': ('department',),
+    'company': ('company_name',),
+}
+
+_index = None
+_rebuild_lock = threading.Lock()
+_rebuilding = False
+
+
+def query_terms(*texts):
+    """The distinct lowercase words of the given search inputs, in order."""
+    terms = []
+    for text in texts:
+        for term in TOKEN_PATTERN.findall((text or '').lower()):
+            if term not in terms:
+                terms.append(term)
+    return terms
+
+
+class InvertedIndex:
+    """
+    Word -> profile ids, over Profile.search_text. The vocabulary is a sorted
+    list, so the words starting with a prefix are one bisect plus a scan of
+    exactly the matching run.
+    """
+    def __init__(self, rows=(), version=0):
+        self.version = version
+        self.built_at = time.monotonic()
+        self._postings = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+        for profile_id, text in rows:
+            self._add(profile_id, text)
+        self._vocabulary = sorted(self._postings)
+
+    @classmethod
+    def build(cls, version=0):
+        return cls(Profile.objects.values_list('id', 'search_text').iterator(chunk_size=2000), version)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _add(self, profile_id, text):
+        words = frozenset(text.split())
+        self._documents[profile_id] = words
+        for word in words:
+            self._postings.setdefault(word, set()).add(profile_id)
+
+    def _remove(self, profile_id):
+        for word in self._documents.pop(profile_id, ()):
+            postings = self._postings[word]
+            postings.discard(profile_id)
+            if not postings:
+                del self._postings[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+
+    def update(self, profile_id, text):
+        """(Re)indexes one profile."""
+        with self._lock:
+            self._remove(profile_id)
+            new_words = [word for word in text.split() if word not in self._postings]
+            self._add(profile_id, text)
+            for word in new_words:
+                insort(self._vocabulary, word)
+
+    def remove(self, profile_id):
+        with self._lock:
+            self._remove(profile_id)
+
+    def expand(self, prefix):
+        """Every indexed word starting with `prefix`, in sorted order."""
+        vocabulary = self._vocabulary
+        position = bisect_left(vocabulary, prefix)
+        words = []
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            words.append(vocabulary[position])
+            position += 1
+        return words
+
+    def search(self, terms):
+        """
+        {profile_id: relevance} for profiles with a word starting with every
+        term. Each term adds the inverse document frequency of the best word
+        it matched, at PREFIX_MATCH_WEIGHT unless the match is exact.
+        """
+        with self._lock:
+            total = len(self._documents)
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for word in self.expand(term):
+                    postings = self._postings[word]
+                    weight = math.log(1 + total / len(postings))
+                    if word != term:
+                        weight *= PREFIX_MATCH_WEIGHT
+                    for profile_id in postings:
+                        if scores is None or profile_id in scores:
+                            if weight > term_scores.get(profile_id, 0):
+                                term_scores[profile_id] = weight
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {profile_id: scores[profile_id] + weight for profile_id, weight in term_scores.items()}
+                if not scores:
+                    break
+            return scores or {}
+
+
+def get_index():
+    """
+    Returns this process's InvertedIndex. An outdated index is still returned
+    while its replacement is built in the background; only the first call in
+    a process builds in-line.
+    """
+    global _index
+    version = cache.get(INDEX_VERSION_KEY, 0)
+    index = _index
+    if index is None:
+        index = _index = InvertedIndex.build(version)
+    elif index.version != version or time.monotonic() - index.built_at > INDEX_MAX_AGE:
+        _rebuild_in_background(version)
+    return index
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    with _rebuild_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, args=(version,), name='search-index-rebuild', daemon=True).start()
+
+
+def _rebuild(version):
+    global _index, _rebuilding
+    # Runs outside any request, so manage this thread's connection here.
+    close_old_connections()
+    try:
+        index = InvertedIndex.build(version)
+        # Don't replace a copy that _sync_index() patched past `version` meanwhile.
+        if _index is None or _index.version <= version:
+            _index = index
+    except Exception:
+        # Keep serving the old index; the next request tries again.
+        pass
+    finally:
+        connections.close_all()
+        _rebuilding = False
+
+
+def _bump_version():
+    try:
+        return cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, 1, None)
+        return 1
+
+
+def index_profile(profile):
+    """Keeps the indexes current after a profile is saved."""
+    _sync_index(profile.pk, profile.search_text)
+
+
+def unindex_profile(profile):
+    _sync_index(profile.pk, None)
+
+
+def _sync_index(profile_id, text):
+    if backend() != 'memory':
+        return
+    index = _index
+    version = _bump_version()
+    # Other processes rebuild on the new version; this one patches its copy.
+    if index is not None and index.version == version - 1:
+        if text is None:
+            index.remove(profile_id)
+        else:
+            index.update(profile_id, text)
+        index.version = version
+
+
+def backend():
+    name = getattr(settings, 'PROFILE_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        return 'mysql' if connection.vendor == 'mysql' else 'memory'
+    return name
+
+
+def _mysql_search(terms, queryset, fields=None):
+    indexed = [term for term in terms if len(term) >= MYSQL_MIN_TOKEN_SIZE]
+    if not indexed:
+        # Too short for the FULLTEXT index.
+        if fields:
+            return queryset.filter(_field_prefix_filter(fields)), {}
+        for term in terms:
+            queryset = queryset.filter(search_text__contains=term)
+        return queryset, {}
+    queryset = queryset.annotate(relevance=RawSQL(
+        f'MATCH({Profile._meta.db_table}.search_text) AGAINST (%s IN BOOLEAN MODE)',
+        (' '.join(f'+{term}*' for term in indexed),),
+    )).filter(relevance__gt=0)
+    if not fields:
+        # Without per-field checks, short terms fall back to a substring filter
+        # on the already narrowed rows.
+        for term in terms:
+            if len(term) < MYSQL_MIN_TOKEN_SIZE:
+                queryset = queryset.filter(search_text__contains=term)
+    return queryset, dict(queryset.values_list('id', 'relevance'))
+
+
+def _field_terms(fields):
+    return {field: terms for field, text in fields.items() if (terms := query_terms(text))}
+
+
+def _field_prefix_filter(fields):
+    """Q requiring each input term to start one of its FIELD_COLUMNS (LIKE 'term%')."""
+    condition = Q()
+    for field, terms in _field_terms(fields).items():
+        for term in terms:
+            term_condition = Q()
+            for column in FIELD_COLUMNS[field]:
+                term_condition |= Q(**{f'{column}__istartswith': term})
+            condition &= term_condition
+    return condition
+
+
+def field_matches(candidates, fields):
+    """
+    Ids of the `candidates` where every word of each input in `fields`
+    ({'name': ..., 'department': ..., 'company': ...}) starts a word of that
+    input's FIELD_COLUMNS. Reads only the candidate rows.
+    """
+    wanted = _field_terms(fields)
+    columns = sorted({column for field in wanted for column in FIELD_COLUMNS[field]})
+    matching = []
+    for profile_id, *values in candidates.values_list('id', *columns):
+        words = {column: TOKEN_PATTERN.findall((value or '').lower()) for column, value in zip(columns, values)}
+        if all(
+            any(word.startswith(term) for column in FIELD_COLUMNS[field] for word in words[column])
+            for field, terms in wanted.items() for term in terms
+        ):
+            matching.append(profile_id)
+    return matching
+
+
+def search_profiles(terms, queryset=None, fields=None):
+    """
+    Narrows `queryset` (default: all profiles) to profiles matching every
+    term as a word prefix. With `fields`, each input must also match within
+    its own columns (see field_matches). Returns (queryset, {profile_id: relevance}).
+    """
+    if queryset is None:
+        queryset = Profile.objects.all()
+    if not terms:
+        return queryset, {}
+    if backend() == 'mysql':
+        candidates, relevance = _mysql_search(terms, queryset, fields)
+    else:
+        relevance = get_index().search(terms)
+        candidates = queryset.filter(id__in=list(relevance))
+    if not fields:
+        return candidates, relevance
+    return queryset.filter(id__in=field_matches(candidates, fields)), relevance
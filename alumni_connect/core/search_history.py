@@ -0,0 +1,124 @@
+# core/search_history.py
+#
+# Write-behind buffer for SearchHistory. find_alumni calls record_search(),
+# which only appends to this process's buffer; rows reach the database with
+# one bulk_create once FLUSH_SIZE are waiting or FLUSH_INTERVAL seconds have
+# passed (a daemon thread checks), and at interpreter exit. A search equal
+# to the user's previous one is dropped, so resubmitting the same filters
+# doesn't add rows.
+#
+# The recommender reads a user's buffered searches together with the stored
+# ones (recent_searches()), so the search is part of their history from the
+# moment it is recorded: record_search() drops the user's cached find_alumni
+# results then, and the ranking for the search itself already includes it.
+# flush() therefore leaves the result cache alone; invalidating it later
+# would re-rank the pages of a search while the user is paging through it.
+# bulk_create sends no post_save, so flush() marks the users' dashboard
+# recommendations stale itself.
+
+import atexit
+import threading
+import time
+
+from django.db import close_old_connections
+
+from . import result_cache
+from .models import SearchHistory
+from .recommender import mark_recommendations_stale
+
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 5
+# Users whose previous search is remembered for deduplication.
+MAX_REMEMBERED_USERS = 10000
+
+_lock = threading.Lock()
+_buffer = []
+_last_query = {}  # user_id -> their latest (name, department, graduation_year, company)
+_flushed_at = time.monotonic()
+_flusher = None
+
+
+def record_search(user_id, name='', department='', graduation_year='', company=''):
+    """
+    Buffers a SearchHistory row unless it repeats the user's previous search.
+    Returns True if the search was buffered.
+    """
+    query = (name, department, graduation_year, company)
+    with _lock:
+        if _last_query.get(user_id) == query:
+            return False
+        _last_query.pop(user_id, None)
+        _last_query[user_id] = query
+        if len(_last_query) > MAX_REMEMBERED_USERS:
+            del _last_query[next(iter(_last_query))]
+        _buffer.append(SearchHistory(
+            user_id=user_id, name=name, department=department,
+            graduation_year=graduation_year, company=company,
+        ))
+        full = len(_buffer) >= FLUSH_SIZE
+    result_cache.invalidate([user_id])
+    _ensure_flusher()
+    if full:
+        flush()
+    return True
+
+
+def pending():
+    """Rows waiting for the next flush."""
+    with _lock:
+        return len(_buffer)
+
+
+def recent_searches(user, limit):
+    """The user's latest `limit` (department, company) searches, buffered ones first."""
+    with _lock:
+        buffered = [(row.department, row.company) for row in reversed(_buffer) if row.user_id == user.id]
+    if len(buffered) >= limit:
+        return buffered[:limit]
+    stored = user.search_history.values_list('department', 'company')[:limit - len(buffered)]
+    return buffered + list(stored)
+
+
+def flush():
+    """Writes every buffered row with one bulk_create. Returns the number written."""
+    global _flushed_at
+    with _lock:
+        rows = _buffer[:]
+        del _buffer[:]
+        _flushed_at = time.monotonic()
+    if not rows:
+        return 0
+    try:
+        SearchHistory.objects.bulk_create(rows, batch_size=500)
+    except Exception:
+        # Keep the rows for the next attempt.
+        with _lock:
+            _buffer[:0] = rows
+        raise
+    mark_recommendations_stale({row.user_id for row in rows})
+    return len(rows)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(1)
+        if pending() and time.monotonic() - _flushed_at >= FLUSH_INTERVAL:
+            # Runs outside any request, so manage this thread's connection here.
+            close_old_connections()
+            try:
+                flush()
+            except Exception:
+                # flush() put the rows back; try again next interval.
+                pass
+
+
+def _ensure_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_flush_periodically, name='search-history-flusher', daemon=True)
+        _flusher.start()
+
+
+atexit.register(flush)
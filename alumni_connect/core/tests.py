@@ -1,3 +1,278 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from messaging.models import Conversation, ConversationParticipant, Message
+
+from . import vector_recommender
+from .mail import MAX_ATTEMPTS, queue_mail, retry_delay, send_due_batch
+from .models import (
+    Connection, Notification, OutboundEmail, Profile, RecommendationCache, SearchHistory, UserCounters,
+)
+from .recommender import score_profiles
+
+
+class HotPathIndexTests(TestCase):
+    """
+    The main view queries must be served by their composite indexes.
+    Checked with EXPLAIN, whose output names the chosen index on both
+    SQLite (EXPLAIN QUERY PLAN) and MySQL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'user{i}', password='pw') for i in range(6)]
+        for i, user in enumerate(cls.users):
+            Profile.objects.create(
+                user=user, full_name=f'User {i}', department='Computer Science',
+                user_type='alumni' if i % 2 else 'student', is_verified=i % 3 != 0,
+            )
+        me = cls.users[0]
+        for other in cls.users[1:3]:
+            Connection.objects.create(sender=other, receiver=me)
+        for other in cls.users[3:]:
+            Connection.objects.create(sender=me, receiver=other, status=Connection.Status.ACCEPTED)
+        for i in range(5):
+            Notification.objects.create(recipient=me, actor=cls.users[1], verb=f'did thing {i}')
+            SearchHistory.objects.create(user=me, department='Computer Science')
+        cls.conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=cls.conversation, user=me)
+        for i in range(5):
+            Message.objects.create(conversation=cls.conversation, sender=me, text=f'message {i}')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"{connection.vendor} plan doesn't use {index_name}:\n{plan}")
+
+    def test_verified_alumni_candidates(self):
+        self.assertUsesIndex(
+            Profile.objects.filter(user_type='alumni', is_verified=True).values_list('id', flat=True),
+            'profile_type_verified_idx',
+        )
+
+    def test_pending_requests_for_receiver(self):
+        self.assertUsesIndex(
+            Connection.objects.filter(receiver=self.users[0], status=Connection.Status.PENDING),
+            'connection_receiver_status_idx',
+        )
+
+    def test_accepted_connections_from_sender(self):
+        self.assertUsesIndex(
+            Connection.objects.filter(sender=self.users[0], status=Connection.Status.ACCEPTED).values_list('receiver_id'),
+            'connection_sender_status_idx',
+        )
+
+    def test_unread_notifications(self):
+        self.assertUsesIndex(
+            Notification.objects.filter(recipient=self.users[0], is_read=False).values('id'),
+            'notification_inbox_idx',
+        )
+
+    def test_recent_searches(self):
+        self.assertUsesIndex(
+            self.users[0].search_history.values_list('department', 'company')[:10],
+            'searchhistory_user_time_idx',
+        )
+
+    def test_message_history_page(self):
+        self.assertUsesIndex(
+            self.conversation.messages.order_by('-created_at', '-id')[:31],
+            'message_history_idx',
+        )
+
+
+@skipUnless(vector_recommender.is_available(), 'numpy is not installed')
+class RecommenderEngineTests(TestCase):
+    """
+    The vectorized engine must rank exactly like the reference scorer,
+    including the order among tied scores when only the top k are selected.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(username=f'user{i}', password='pw') for i in range(12)]
+        cls.me = Profile.objects.create(
+            user=users[0], full_name='Me', department='Computer Science', user_type='student', is_verified=True,
+        )
+        # Three groups of identical alumni, so most scores are tied.
+        for i, user in enumerate(users[1:], start=1):
+            Profile.objects.create(
+                user=user, full_name=f'Alumnus {i}', user_type='alumni', is_verified=True,
+                department=['Computer Science', 'Civil Engineering', 'Computer Science'][i % 3],
+                company_name=['Google', 'Infosys', ''][i % 3],
+                job_title=['Software Engineer', '', 'Data Analyst'][i % 3],
+            )
+        # A connection and a friend of a friend, and a past search.
+        Connection.objects.create(sender=users[0], receiver=users[1], status=Connection.Status.ACCEPTED)
+        Connection.objects.create(sender=users[1], receiver=users[5], status=Connection.Status.ACCEPTED)
+        SearchHistory.objects.create(user=users[0], department='Civil Engineering', company='Infosys')
+
+    def setUp(self):
+        cache.clear()
+        vector_recommender.invalidate_snapshot()
+
+    def assertSameRanking(self, base_queryset=None, relevance=None):
+        expected = score_profiles(self.me, base_queryset, relevance=relevance)
+        actual = vector_recommender.rank_profiles(self.me, base_queryset, relevance=relevance)
+        self.assertEqual(len(expected), len(actual))
+        self.assertEqual(expected.top(3), actual.top(3))
+        self.assertEqual(expected.top(), actual.top())
+
+    def test_default_ranking(self):
+        self.assertSameRanking()
+
+    def test_stale_snapshot_skips_unverified_profiles(self):
+        vector_recommender.get_snapshot()
+        # Another process unverifies someone; this process's snapshot still has them.
+        unverified_id = score_profiles(self.me).top(1)[0][0]
+        Profile.objects.filter(pk=unverified_id).update(is_verified=False)
+
+        expected = [entry['profile'].id for entry in score_profiles(self.me).recommendations()]
+        actual = [entry['profile'].id for entry in vector_recommender.rank_profiles(self.me).recommendations()]
+        self.assertNotIn(unverified_id, actual)
+        self.assertEqual(expected, actual)
+
+    def test_search_ranking_with_relevance(self):
+        base_queryset = Profile.objects.filter(user_type='alumni', is_verified=True).exclude(user=self.me.user)
+        ids = list(base_queryset.order_by('id').values_list('id', flat=True))
+        # Exactly representable values, some of which keep scores tied.
+        relevance = {ids[0]: 1.0, ids[3]: 1.0, ids[4]: 0.5, ids[6]: 0.5}
+        self.assertSameRanking(base_queryset, relevance)
+
+
+class CounterTests(TestCase):
+    """The sidebar badges follow connection requests, and reconcile_counters repairs drift."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='student', password='pw')
+        cls.alumnus = User.objects.create_user(username='alumnus', password='pw', email='alumnus@example.com')
+        Profile.objects.create(user=cls.student, full_name='Student', user_type='student', is_verified=True)
+        Profile.objects.create(user=cls.alumnus, full_name='Alumnus', user_type='alumni', is_verified=True)
+
+    def counters(self, user):
+        return UserCounters.objects.get(pk=user.pk)
+
+    def test_request_and_accept(self):
+        # Existing rows, so the deltas are applied rather than recomputed.
+        UserCounters.objects.bulk_create([UserCounters(user=self.student), UserCounters(user=self.alumnus)])
+        self.client.force_login(self.student)
+        self.client.post(reverse('core:send_connection_request', args=[self.alumnus.id]))
+        self.assertEqual(self.counters(self.alumnus).pending_requests, 1)
+
+        request = Connection.objects.get(sender=self.student, receiver=self.alumnus)
+        self.client.force_login(self.alumnus)
+        self.client.post(reverse('core:respond_to_connection_request', args=[request.id, 'accept']))
+        self.assertEqual(self.counters(self.alumnus).pending_requests, 0)
+        self.assertEqual(self.counters(self.student).unread_notifications, 1)
+
+    def test_reconcile_repairs_drift(self):
+        Connection.objects.create(sender=self.student, receiver=self.alumnus)
+        Notification.objects.create(recipient=self.student, actor=self.alumnus, verb='did a thing')
+        UserCounters.objects.create(user=self.alumnus, pending_requests=7, unread_notifications=3)
+
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(
+            (self.counters(self.alumnus).pending_requests, self.counters(self.alumnus).unread_notifications), (1, 0)
+        )
+        # A user without a row gets one.
+        self.assertEqual(self.counters(self.student).unread_notifications, 1)
+
+
+class RecommendationInvalidationTests(TestCase):
+    """Only saves that change a scoring field mark cached recommendations stale."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumnus = User.objects.create_user(username='alumnus', password='pw')
+        Profile.objects.create(user=cls.alumnus, full_name='Alumnus', user_type='alumni', department='Civil', is_verified=True)
+        cls.viewer = User.objects.create_user(username='viewer', password='pw')
+
+    def setUp(self):
+        self.cached = RecommendationCache.objects.create(user=self.viewer)
+
+    def is_stale(self):
+        self.cached.refresh_from_db()
+        return self.cached.is_stale
+
+    def test_settings_toggle_keeps_recommendations(self):
+        self.client.force_login(self.alumnus)
+        self.client.post(reverse('core:notification_settings'), {})
+        self.assertFalse(Profile.objects.get(user=self.alumnus).email_on_connection_accepted)
+        # A full save without scoring changes doesn't count either.
+        profile = Profile.objects.get(user=self.alumnus)
+        profile.currently_employed = True
+        profile.save()
+        self.assertFalse(self.is_stale())
+
+    def test_scoring_change_marks_stale(self):
+        profile = Profile.objects.get(user=self.alumnus)
+        profile.department = 'Architecture'
+        profile.save()
+        self.assertTrue(self.is_stale())
+
+
+class OutboxTests(TestCase):
+    """Queued mail is only kept if the transaction commits, and send_due_batch delivers or backs off."""
+
+    def test_queued_with_the_transaction(self):
+        with transaction.atomic():
+            queue_mail(to='kept@example.com', subject='Kept', body='Hi')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            queue_mail(to='dropped@example.com', subject='Dropped', body='Hi')
+            raise RuntimeError('the view failed')
+        self.assertEqual(list(OutboundEmail.objects.values_list('to', flat=True)), ['kept@example.com'])
+        self.assertEqual(mail.outbox, [])
+
+    def test_accepting_a_request_queues_mail(self):
+        sender = User.objects.create_user(username='sender', password='pw', email='sender@example.com')
+        receiver = User.objects.create_user(username='receiver', password='pw')
+        Profile.objects.create(user=sender, full_name='Sender', user_type='student', is_verified=True)
+        Profile.objects.create(user=receiver, full_name='Receiver', user_type='alumni', is_verified=True)
+        request = Connection.objects.create(sender=sender, receiver=receiver)
+
+        self.client.force_login(receiver)
+        self.client.post(reverse('core:respond_to_connection_request', args=[request.id, 'accept']))
+        self.assertEqual(OutboundEmail.objects.get().to, 'sender@example.com')
+        self.assertEqual(mail.outbox, [])
+
+    def test_send_marks_sent(self):
+        queue_mail(to='a@example.com', subject='Hello', body='Text', html_body='<p>Text</p>')
+        self.assertEqual(send_due_batch(), (1, 0))
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.Status.SENT, 1))
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com']])
+        self.assertEqual(send_due_batch(), (0, 0))
+
+    def test_failure_backs_off_until_max_attempts(self):
+        email = queue_mail(to='a@example.com', subject='Hello', body='Text')
+        with mock.patch('core.mail.EmailMultiAlternatives.send', side_effect=OSError('connection refused')):
+            before = timezone.now()
+            self.assertEqual(send_due_batch(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.Status.QUEUED, 1))
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=retry_delay(1)))
+            self.assertIn('connection refused', email.last_error)
+            # Not due again until the delay has passed.
+            self.assertEqual(send_due_batch(), (0, 0))
+
+            for _ in range(MAX_ATTEMPTS - 1):
+                OutboundEmail.objects.update(next_attempt_at=timezone.now())
+                send_due_batch()
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.Status.FAILED, MAX_ATTEMPTS))
 
-# Create your tests here.
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(send_due_batch(), (0, 0))
+        self.assertEqual(mail.outbox, [])
@@ -0,0 +1,103 @@
+# core/tokens.py
+#
+# Word tokenization for the recommender and the alumni search index, plus an
+# in-process LRU of each profile's token sets so scoring never re-tokenizes
+# unchanged text.
+
+import re
+import threading
+from collections import OrderedDict
+
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+
+
+def tokenize(text):
+    """Returns the set of lowercase word tokens in text (empty for None/'')."""
+    return frozenset(TOKEN_PATTERN.findall(text.lower())) if text else frozenset()
+
+
+def serialize_tokens(tokens):
+    """Stores a token set as a space-separated string (tokens never contain spaces)."""
+    return ' '.join(sorted(tokens))
+
+
+# Profile fields whose words go into Profile.search_text (with the username).
+SEARCH_TEXT_FIELDS = (
+    'full_name', 'department', 'company_name', 'job_title',
+    'past_job_title', 'past_company_name', 'bio',
+)
+
+
+def search_text(profile, username=''):
+    """The distinct words of a profile's searchable fields, space-separated."""
+    tokens = set(tokenize(username))
+    for field in SEARCH_TEXT_FIELDS:
+        tokens.update(tokenize(getattr(profile, field)))
+    return serialize_tokens(tokens)
+
+
+def stored_tokens(text, stored):
+    """Reads a stored token column, tokenizing text only if it was never filled."""
+    if stored or not text:
+        return frozenset(stored.split())
+    return tokenize(text)
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of (bio tokens, job title tokens) keyed by
+    (profile id, profile.updated_at), so an edited profile misses naturally.
+    """
+    def __init__(self, maxsize=50000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, profile):
+        key = (profile.pk, profile.updated_at)
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        tokens = (
+            stored_tokens(profile.bio, profile.bio_tokens),
+            stored_tokens(profile.job_title, profile.job_title_tokens),
+        )
+        if profile.pk is None:
+            return tokens
+        with self._lock:
+            self._entries[key] = tokens
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return tokens
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        """Hit/miss counters for this process, for checking the cache under load."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+token_cache = TokenCache()
+
+
+def profile_tokens(profile):
+    """Returns (bio_tokens, job_title_tokens) for a profile, via the LRU."""
+    return token_cache.get(profile)
@@ -25,6 +25,7 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
 
     path("find-alumni/", views.find_alumni, name="find_alumni"),
+    path("find-alumni/autocomplete/", views.alumni_autocomplete, name="alumni_autocomplete"),
 
     path('connect/send/<int:user_id>/', views.send_connection_request, name='send_connection_request'),
     path('connect/requests/', views.connection_requests_list, name='connection_requests'),
@@ -0,0 +1,239 @@
+# core/vector_recommender.py
+#
+# Vectorized version of the hybrid recommender in core/recommender.py.
+# Every verified alumnus becomes one row of a column-oriented feature matrix,
+# so a whole population is scored with a handful of array operations instead
+# of a Python loop. The weights and tie-breaking match score_profiles()
+# exactly; only the execution strategy differs.
+
+import time
+
+from django.core.cache import cache
+
+from .models import Profile
+from .recommender import DEPARTMENT_KEYWORDS, RankedProfiles, get_personalization_data, score_profiles
+from .tokens import profile_tokens, stored_tokens
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; get_recommendations() falls back to Python.
+    np = None
+
+# Bumped in the shared cache whenever a scoring field changes, so every
+# process rebuilds its snapshot on the next request.
+SNAPSHOT_VERSION_KEY = 'recommender:snapshot_version'
+
+# Upper bound on how long a process keeps a snapshot when the cache backend
+# is not shared between processes (e.g. the default LocMemCache).
+SNAPSHOT_MAX_AGE = 300
+
+# Every keyword the recommender knows about, in a fixed column order.
+KEYWORD_VOCABULARY = sorted({word for words in DEPARTMENT_KEYWORDS.values() for word in words})
+KEYWORD_COLUMNS = {word: column for column, word in enumerate(KEYWORD_VOCABULARY)}
+
+_snapshot = None
+
+
+def is_available():
+    return np is not None
+
+
+def _normalize(text):
+    return (text or "").strip().lower()
+
+
+def _encode(values, vocabulary, skip_empty=True):
+    """Integer-codes values against a growing vocabulary; skipped values become -1."""
+    codes = np.full(len(values), -1, dtype=np.int64)
+    for row, value in enumerate(values):
+        if value or not skip_empty:
+            codes[row] = vocabulary.setdefault(value, len(vocabulary))
+    return codes
+
+
+class ProfileMatrix:
+    """
+    Feature matrix for every verified alumnus, ordered by profile id.
+
+    - departments and companies are one-hot encoded as integer codes, both
+      normalized (for equality scoring) and raw (for Counter lookups);
+    - job titles become a dense row x keyword bag-of-words over
+      DEPARTMENT_KEYWORDS;
+    - bios are stored as a sparse token x row matrix (one posting array of
+      row indices per token), so overlap counts are a sparse mat-vec product.
+    """
+    def __init__(self, rows, version):
+        self.version = version
+        self.built_at = time.monotonic()
+
+        rows = list(rows)
+        self.size = len(rows)
+        self.profile_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.user_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        self.row_of_profile = {profile_id: index for index, profile_id in enumerate(self.profile_ids.tolist())}
+        self.row_of_user = {user_id: index for index, user_id in enumerate(self.user_ids.tolist())}
+
+        self.department_vocabulary = {}
+        self.department_codes = _encode([_normalize(row[2]) for row in rows], self.department_vocabulary)
+        self.raw_department_vocabulary = {}
+        self.raw_department_codes = _encode([row[2] for row in rows], self.raw_department_vocabulary, skip_empty=False)
+        self.company_vocabulary = {}
+        self.company_codes = _encode([_normalize(row[3]) for row in rows], self.company_vocabulary)
+        self.raw_company_vocabulary = {}
+        self.raw_company_codes = _encode([row[3] for row in rows], self.raw_company_vocabulary)
+
+        self.has_job_title = np.array([bool(row[4]) for row in rows], dtype=np.int64)
+        self.job_keywords = np.zeros((self.size, len(KEYWORD_VOCABULARY)), dtype=np.int64)
+        bio_postings = {}
+        for index, row in enumerate(rows):
+            for word in stored_tokens(row[4], row[6]):
+                column = KEYWORD_COLUMNS.get(word)
+                if column is not None:
+                    self.job_keywords[index, column] = 1
+            for word in stored_tokens(row[5], row[7]):
+                bio_postings.setdefault(word, []).append(index)
+        self.bio_postings = {word: np.array(indices, dtype=np.int64) for word, indices in bio_postings.items()}
+
+    @classmethod
+    def build(cls, version):
+        rows = Profile.objects.filter(
+            user_type='alumni', is_verified=True
+        ).order_by('id').values_list(
+            'id', 'user_id', 'department', 'company_name', 'job_title', 'bio', 'job_title_tokens', 'bio_tokens'
+        )
+        return cls(rows, version)
+
+    def _lookup_weights(self, vocabulary, *weighted_counters):
+        # One extra trailing slot so code -1 (missing value) picks up a zero.
+        weights = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        for counter, weight in weighted_counters:
+            for value, count in counter.items():
+                code = vocabulary.get(value)
+                if code is not None:
+                    weights[code] += count * weight
+        return weights
+
+    def score(self, profile, data):
+        """Scores every row for `profile`; mirrors score_profiles() term by term."""
+        scores = np.zeros(self.size, dtype=np.int64)
+
+        # --- A. CONTENT-BASED SCORING ---
+        department_code = self.department_vocabulary.get(_normalize(profile.department), -2)
+        company_code = self.company_vocabulary.get(_normalize(profile.company_name), -2)
+        same_department = (self.department_codes == department_code).astype(np.int64)
+        same_company = (self.company_codes == company_code).astype(np.int64)
+
+        keyword_vector = np.zeros(len(KEYWORD_VOCABULARY), dtype=np.int64)
+        for word in DEPARTMENT_KEYWORDS.get(profile.department, []):
+            keyword_vector[KEYWORD_COLUMNS[word]] = 1
+        keyword_hits = self.job_keywords @ keyword_vector
+
+        if profile.user_type == 'student':
+            scores += same_department * 50 + keyword_hits * 15
+        else:
+            scores += same_company * 40 + keyword_hits * 20 + same_department * 15
+
+        bio_words, _ = profile_tokens(profile)
+        bio_rows = [self.bio_postings[word] for word in bio_words if word in self.bio_postings]
+        if bio_rows:
+            scores += np.bincount(np.concatenate(bio_rows), minlength=self.size) * 5
+        scores += self.has_job_title * 5
+
+        # --- B. BEHAVIORAL & COLLABORATIVE SCORING ---
+        department_weights = self._lookup_weights(
+            self.raw_department_vocabulary,
+            (data['connected_departments'], 20), (data['searched_departments'], 10),
+        )
+        company_weights = self._lookup_weights(
+            self.raw_company_vocabulary,
+            (data['connected_companies'], 20), (data['searched_companies'], 10),
+        )
+        scores += department_weights[self.raw_department_codes] + company_weights[self.raw_company_codes]
+
+        for user_id, mutual_count in data['level2_profile_ids'].items():
+            row = self.row_of_user.get(user_id)
+            if row is not None:
+                scores[row] += mutual_count * 30
+        return scores
+
+
+def get_snapshot():
+    """Returns this process's ProfileMatrix, rebuilding it when it is outdated."""
+    global _snapshot
+    version = cache.get(SNAPSHOT_VERSION_KEY, 0)
+    snapshot = _snapshot
+    if (
+        snapshot is None
+        or snapshot.version != version
+        or time.monotonic() - snapshot.built_at > SNAPSHOT_MAX_AGE
+    ):
+        snapshot = _snapshot = ProfileMatrix.build(version)
+    return snapshot
+
+
+def invalidate_snapshot():
+    """Forces every process to rebuild its ProfileMatrix on next use."""
+    global _snapshot
+    _snapshot = None
+    try:
+        cache.incr(SNAPSHOT_VERSION_KEY)
+    except ValueError:
+        cache.set(SNAPSHOT_VERSION_KEY, 1, None)
+
+
+def top_k(scores, rows, k=None):
+    """
+    Orders `rows` (ascending row indices) by score, highest first, keeping the
+    original order among equal scores. With `k`, only the best k rows are
+    selected with argpartition before the (small) final sort.
+    """
+    row_scores = scores[rows]
+    if k is not None and k < len(rows):
+        kth = np.argpartition(-row_scores, k - 1)[k - 1]
+        threshold = row_scores[kth]
+        above = np.flatnonzero(row_scores > threshold)
+        ties = np.flatnonzero(row_scores == threshold)[:k - len(above)]
+        chosen = np.sort(np.concatenate((above, ties)))
+    else:
+        chosen = np.arange(len(rows))
+    order = chosen[np.argsort(-row_scores[chosen], kind='stable')]
+    return rows[order]
+
+
+def rank_profiles(profile_to_recommend_for, base_queryset=None, snapshot=None, relevance=None):
+    """
+    Drop-in replacement for core.recommender.rank_profiles().
+    `base_queryset` is expected to contain verified alumni only; anything
+    outside the snapshot is handed to the pure-Python scorer instead.
+    """
+    from .search import SEARCH_RELEVANCE_WEIGHT
+
+    matrix = get_snapshot()
+    data = get_personalization_data(profile_to_recommend_for.user, snapshot)
+    scores = matrix.score(profile_to_recommend_for, data)
+    if relevance:
+        scores = scores.astype(np.float64)
+        for profile_id, value in relevance.items():
+            row = matrix.row_of_profile.get(profile_id)
+            if row is not None:
+                scores[row] += value * SEARCH_RELEVANCE_WEIGHT
+
+    if base_queryset is not None:
+        profile_ids = list(base_queryset.values_list('id', flat=True))
+        rows = [matrix.row_of_profile.get(profile_id) for profile_id in profile_ids]
+        if None in rows:
+            return score_profiles(profile_to_recommend_for, base_queryset, snapshot, relevance)
+        candidates = np.sort(np.array(rows, dtype=np.int64))
+    else:
+        # By default, don't recommend the user or people they're connected to.
+        excluded_users = np.array(
+            [profile_to_recommend_for.user_id, *data['level1_connection_ids']], dtype=np.int64
+        )
+        eligible = (scores > 0) & ~np.isin(matrix.user_ids, excluded_users)
+        candidates = np.flatnonzero(eligible)
+
+    def select_top(k):
+        ranked_rows = top_k(scores, candidates, k)
+        return list(zip(matrix.profile_ids[ranked_rows].tolist(), scores[ranked_rows].tolist()))
+
+    return RankedProfiles(len(candidates), select_top)
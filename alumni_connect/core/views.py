@@ -7,20 +7,26 @@ from django.contrib.auth.models import User
 from django.views.decorators.http import require_POST
 from django.contrib.auth.hashers import make_password
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from django.contrib.auth.forms import PasswordChangeForm
-from django.core.mail import send_mail
+from django.http import Http404, JsonResponse
 from django.template.loader import render_to_string
 from django.core.paginator import Paginator
-from django.conf import settings
 # MODIFICATION: Imported the new form
 from .forms import (
     RegistrationForm, ProfileUpdateForm, SettingsForm, 
     AccountUserUpdateForm, AccountProfileUpdateForm, AccountProfileSettingsForm
 )
 from django.core.paginator import Paginator
-from .models import Profile, Connection, Notification, SearchHistory
-from .recommender import get_recommendations
+from .models import Profile, Connection, Notification
+from .recommender import get_cached_recommendations, rank_profiles
+from . import autocomplete, counters, graph
+from .mail import queue_mail
+from .notifications import notification_page, notify
+from .search import query_terms, search_profiles
+from .result_cache import cached_ranking, normalize_query
+from .search_history import record_search
 from django.urls import reverse
 from .decorators import verification_required
 from messaging.models import Conversation
@@ -119,8 +125,9 @@ def student_dashboard_view(request):
 
     if profile.is_verified:
         # --- THIS IS THE FIX: Call the AI recommender ---
-        # We also limit the results to the top 5 for the dashboard
-        suggested_alumni = get_recommendations(profile)[:5]
+        # We also limit the results to the top 5 for the dashboard.
+        # Read from the materialized cache; it rescores only when stale.
+        suggested_alumni = get_cached_recommendations(profile, limit=5)
 
         # Get the 5 most recently joined alumni (your existing correct logic)
         recent_alumni = Profile.objects.filter(
@@ -129,10 +136,7 @@ def student_dashboard_view(request):
         ).exclude(user=request.user).order_by('-user__date_joined')[:5]
         
         # Get the student's connection count (your existing correct logic)
-        connection_count = Connection.objects.filter(
-            (Q(sender=request.user) | Q(receiver=request.user)),
-            status=Connection.Status.ACCEPTED
-        ).count()
+        connection_count = graph.degree(request.user.id)
 
     # The context remains the same, but 'suggested_alumni' now has the correct data structure
     context = {
@@ -171,10 +175,7 @@ def alumni_dashboard_view(request):
         ).exclude(user=request.user).order_by('-user__date_joined')[:5]
 
         # Get connection count (your existing code)
-        connection_count = Connection.objects.filter(
-            (Q(sender=request.user) | Q(receiver=request.user)),
-            status=Connection.Status.ACCEPTED
-        ).count()
+        connection_count = graph.degree(request.user.id)
 
         # Get student message count (your existing code)
         student_message_count = Conversation.objects.filter(
@@ -189,7 +190,7 @@ def alumni_dashboard_view(request):
         try:
             # The get_recommendations function returns a list of dictionaries.
             # We extract just the 'profile' object from each dictionary.
-            recommendations_data = get_recommendations(profile)[:5]
+            recommendations_data = get_cached_recommendations(profile, limit=5)
             recommended_alumni = [rec['profile'] for rec in recommendations_data]
         except Exception as e:
             # Handle potential errors from the recommender gracefully
@@ -209,7 +210,9 @@ def alumni_dashboard_view(request):
 
 @login_required
 def profile_view(request):
-    user_profile = get_object_or_404(Profile, user=request.user)
+    user_profile = request.profile
+    if user_profile is None:
+        raise Http404("No Profile matches the given query.")
     
     # --- ADD THIS LOGIC ---
     display_job_title = ""
@@ -251,7 +254,7 @@ def profile_update_view(request):
 @verification_required
 def profile_page_view(request, user_id):
     viewed_profile = get_object_or_404(Profile, user__id=user_id)
-    user_profile = get_object_or_404(Profile, user=request.user)
+    user_profile = request.profile
     
     # --- ADD THIS LOGIC ---
     display_job_title = ""
@@ -280,7 +283,7 @@ def profile_page_view(request, user_id):
 @login_required
 @verification_required
 def find_alumni(request):
-    user_profile = get_object_or_404(Profile, user=request.user)
+    user_profile = request.profile
 
     # --- THE FIX: Use .strip() to handle empty searches correctly ---
     name = request.GET.get("name", "").strip()
@@ -291,49 +294,45 @@ def find_alumni(request):
     # is_searching is now only True if at least one field has actual content
     is_searching = bool(name or department or graduation_year or company)
 
-    # Save search history only if it's a real search
-    if is_searching:
-        SearchHistory.objects.create(
-            user=request.user,
-            name=name,
-            department=department,
-            graduation_year=graduation_year,
-            company=company
-        )
-
-    if is_searching:
+    page_number = request.GET.get('page')
+
+    # Save search history only if it's a real search, and only once: paging
+    # through the results of a search doesn't repeat it. The row is buffered
+    # and written in bulk by core.search_history.
+    if is_searching and not page_number:
+        record_search(request.user.id, name, department, graduation_year, company)
+
+    def rank():
+        if not is_searching:
+            # If the form is submitted with empty fields, this block will now run correctly
+            return rank_profiles(user_profile)
+
         # Step 1: Filter the alumni list based on the user's explicit query.
         base_queryset = Profile.objects.filter(
             is_verified=True, user_type="alumni"
         ).exclude(user=request.user)
 
-        if name:
-            # This searches both the full_name field on the profile and the username field on the user
-            base_queryset = base_queryset.filter(
-                Q(full_name__icontains=name) | Q(user__username__icontains=name)
-            )
-        if department:
-            base_queryset = base_queryset.filter(department__icontains=department)
         if graduation_year:
             try:
                 base_queryset = base_queryset.filter(graduation_year=int(graduation_year))
             except (ValueError, TypeError):
                 pass
-        if company:
-            base_queryset = base_queryset.filter(company_name__icontains=company)
-        
-        # Step 2: Rank the filtered results using the AI recommender
-        recommendations = get_recommendations(user_profile, base_queryset=base_queryset)
-        alumni_profiles_list = [rec['profile'] for rec in recommendations]
+        # Name, department and company words are matched as prefixes: the search
+        # index narrows the candidates and scores relevance, then each input is
+        # checked against its own field (name or username, department, company)
+        fields = {'name': name, 'department': department, 'company': company}
+        base_queryset, relevance = search_profiles(query_terms(*fields.values()), base_queryset, fields)
 
-    else:
-        # If the form is submitted with empty fields, this block will now run correctly
-        recommendations = get_recommendations(user_profile)
-        alumni_profiles_list = [rec['profile'] for rec in recommendations]
-    
-    # Step 3: Paginate the final list
+        # Step 2: Rank the filtered results using the AI recommender, blended with search relevance
+        return rank_profiles(user_profile, base_queryset=base_queryset, relevance=relevance)
+
+    # Later pages of the same query are sliced from the cached ranking.
+    query = normalize_query(name, department, graduation_year, company)
+    alumni_profiles_list, _ = cached_ranking(request.user.id, query, rank)
+
+    # Step 3: Paginate the final list. The ranking is lazy: only the top
+    # page * 9 entries are selected, and only this page's rows are loaded.
     paginator = Paginator(alumni_profiles_list, 9)
-    page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
     context = {
@@ -345,6 +344,20 @@ def find_alumni(request):
     }
     return render(request, "core/find_alumni.html", context)
 
+@login_required
+@verification_required
+def alumni_autocomplete(request):
+    """Typeahead for the find_alumni form: ?q=<prefix>[&field=name|company|department][&limit=N]."""
+    field = request.GET.get('field') or None
+    if field is not None and field not in autocomplete.FIELDS:
+        return JsonResponse({'ok': False, 'error': 'Unknown field'}, status=400)
+    try:
+        limit = int(request.GET.get('limit', autocomplete.DEFAULT_SUGGESTIONS))
+    except ValueError:
+        limit = autocomplete.DEFAULT_SUGGESTIONS
+    suggestions = autocomplete.suggest(request.GET.get('q', ''), field, max(limit, 1))
+    return JsonResponse({'ok': True, 'suggestions': suggestions})
+
 @login_required
 @verification_required
 def send_connection_request(request, user_id):
@@ -372,7 +385,9 @@ def send_connection_request(request, user_id):
         return redirect('core:profile_page', user_id=user_id)
 
     # Create the connection
-    Connection.objects.create(sender=sender, receiver=receiver)
+    with transaction.atomic():
+        Connection.objects.create(sender=sender, receiver=receiver)
+        counters.adjust(receiver.id, pending_requests=1)
     messages.success(request, "Your connection request has been sent!")
     return redirect('core:profile_page', user_id=user_id)
 
@@ -382,7 +397,7 @@ def send_connection_request(request, user_id):
 def connection_requests_list(request):
     """Display a list of pending connection requests for the logged-in user."""
     pending_requests = Connection.objects.filter(receiver=request.user, status=Connection.Status.PENDING)
-    user_profile = get_object_or_404(Profile, user=request.user)
+    user_profile = request.profile
     context = {
         'requests': pending_requests,
         'profile': user_profile,  # Still need this for the image and verification check
@@ -397,47 +412,39 @@ def respond_to_connection_request(request, request_id, action):
     
     sender = connection_request.sender
     actor = request.user
+    was_pending = connection_request.status == Connection.Status.PENDING
 
     if action == "accept":
-        connection_request.status = Connection.Status.ACCEPTED
-        connection_request.save()
-        messages.success(request, f"You are now connected with {sender.username}.")
-
         profile_link = request.build_absolute_uri(reverse('core:profile_page', kwargs={'user_id': actor.id}))
-        Notification.objects.create(
-            recipient=sender,
-            actor=actor,
-            verb='accepted your connection request.',
-            link=profile_link
-        )
-
-        # --- NEW: Logic to send the email notification ---
-        if sender.profile.email_on_connection_accepted:
-            context = {
-                'recipient_name': sender.profile.full_name or sender.username,
-                'actor_name': actor.profile.full_name or actor.username,
-                'profile_link': profile_link,
-            }
-            email_plain_text = render_to_string('core/emails/connection_accepted_email.txt', context)
-            email_html = render_to_string('core/emails/connection_accepted_email.html', context)
-
-            send_mail(
-                subject=f"{actor.profile.full_name or actor.username} accepted your connection request!",
-                message=email_plain_text,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[sender.email],
-                html_message=email_html,
-                fail_silently=False
-            )
-        # --- End of new email logic ---
+        with transaction.atomic():
+            connection_request.status = Connection.Status.ACCEPTED
+            connection_request.save()
+            if was_pending:
+                counters.adjust(actor.id, pending_requests=-1)
+
+            notify([(sender, actor, 'accepted your connection request.', profile_link)])
+
+            # Email notification: queued in the outbox, sent by `manage.py send_queued_mail`
+            if sender.profile.email_on_connection_accepted:
+                context = {
+                    'recipient_name': sender.profile.full_name or sender.username,
+                    'actor_name': actor.profile.full_name or actor.username,
+                    'profile_link': profile_link,
+                }
+                queue_mail(
+                    to=sender.email,
+                    subject=f"{actor.profile.full_name or actor.username} accepted your connection request!",
+                    body=render_to_string('core/emails/connection_accepted_email.txt', context),
+                    html_body=render_to_string('core/emails/connection_accepted_email.html', context),
+                )
+        messages.success(request, f"You are now connected with {sender.username}.")
 
     elif action == "decline":
-        Notification.objects.create(
-            recipient=sender,
-            actor=actor,
-            verb='declined your connection request.'
-        )
-        connection_request.delete()
+        with transaction.atomic():
+            notify([(sender, actor, 'declined your connection request.', None)])
+            connection_request.delete()
+            if was_pending:
+                counters.adjust(actor.id, pending_requests=-1)
         messages.info(request, "Connection request declined.")
 
     return redirect('core:connection_requests')
@@ -472,23 +479,25 @@ def connection_list_view(request):
 @login_required
 @verification_required
 def notification_list_view(request):
-    """Display a paginated list of notifications and mark them as read."""
-    # Get all notifications for the user first, ordered by newest first
-    all_notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
-    
-    # --- THIS IS THE NEW PAGINATION LOGIC ---
-    paginator = Paginator(all_notifications, 15) # Show 15 notifications per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    """Display a page of notifications (keyset-paginated) and mark them as read."""
+    before = request.GET.get('before')
+    try:
+        page, older_cursor = notification_page(request.user, before=before)
+    except ValueError:
+        return redirect('core:notification_list')
+
     # --- IMPROVEMENT: Mark only the notifications on the CURRENT page as read ---
     # This is more efficient than updating all notifications every time.
-    unread_ids = [n.id for n in page_obj if not n.is_read]
+    unread_ids = [n.id for n in page if not n.is_read]
     if unread_ids:
-        Notification.objects.filter(pk__in=unread_ids).update(is_read=True)
+        with transaction.atomic():
+            marked = Notification.objects.filter(pk__in=unread_ids, is_read=False).update(is_read=True)
+            counters.adjust(request.user.id, unread_notifications=-marked)
 
     context = {
-        'notifications_page': page_obj,  # Pass the page object to the template
+        'notifications_page': page,
+        'older_cursor': older_cursor,
+        'is_first_page': before is None,
         'profile': request.user.profile
     }
     return render(request, 'core/notifications.html', context)
@@ -501,7 +510,10 @@ def delete_notification(request, notification_id):
     # This is a critical security step.
     notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
     
-    notification.delete()
+    with transaction.atomic():
+        notification.delete()
+        if not notification.is_read:
+            counters.adjust(request.user.id, unread_notifications=-1)
     
     messages.success(request, "Notification removed.")
     return redirect('core:notification_list')
@@ -615,7 +627,8 @@ def notification_settings_view(request):
         # We use the SettingsForm you already created
         settings_form = SettingsForm(request.POST, instance=request.user.profile)
         if settings_form.is_valid():
-            settings_form.save()
+            # Only the preference columns; a full save would look like a profile edit.
+            settings_form.save(commit=False).save(update_fields=settings_form.changed_data)
             messages.success(request, 'Your notification settings have been updated.')
             return redirect('core:notification_settings') # Redirect back to the same page
     else:
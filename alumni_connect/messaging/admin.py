@@ -5,14 +5,14 @@ from .models import Conversation, ConversationParticipant, Message
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     # THE FIX: Removed 'is_group' which no longer exists
-    list_display = ("id", "unique_key", "updated_at")
+    list_display = ("id", "unique_key", "updated_at", "latest_created_at")
     # THE FIX: Removed 'is_group' from here as well
     list_filter = () 
 
 @admin.register(ConversationParticipant)
 class ConversationParticipantAdmin(admin.ModelAdmin):
     # THE FIX: Removed 'last_read_at' which no longer exists
-    list_display = ("id", "conversation", "user", "joined_at")
+    list_display = ("id", "conversation", "user", "joined_at", "read_up_to")
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
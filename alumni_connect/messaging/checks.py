@@ -0,0 +1,32 @@
+# messaging/checks.py
+#
+# Online status is counted in the 'presence' cache (messaging/presence.py),
+# which only works when every ASGI worker talks to the same cache.
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+PER_PROCESS_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register()
+def check_presence_cache(app_configs, **kwargs):
+    from .presence import PRESENCE_CACHE
+
+    config = settings.CACHES.get(PRESENCE_CACHE)
+    if config is None:
+        return [Error(
+            f"CACHES has no '{PRESENCE_CACHE}' entry.",
+            hint='Point it at a shared backend such as the Redis server used by CHANNEL_LAYERS.',
+            id='messaging.E001',
+        )]
+    if config.get('BACKEND') in PER_PROCESS_BACKENDS:
+        return [Warning(
+            f"The '{PRESENCE_CACHE}' cache is per process, so online status is wrong with more than one worker.",
+            hint='Use a shared backend such as RedisCache.',
+            id='messaging.W001',
+        )]
+    return []
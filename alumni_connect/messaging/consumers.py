@@ -1,89 +1,132 @@
 # messaging/consumers.py
+import asyncio
 import json
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.db.models import Max, Q
 from django.utils import timezone
 
-from .models import Message, Conversation, ReadReceipt, DeliveryReceipt
+from . import presence
+from .models import Message, Conversation, ConversationParticipant
+from .utils import advance_watermarks, record_latest_message, refresh_conversation_counters
 from core.models import Profile
 
 User = get_user_model()
 
+# Acks arriving within this many seconds of the first one are written and
+# broadcast together.
+ACK_COALESCE_SECONDS = 0.2
+# Most message ids accepted in one ack frame; anything beyond is ignored.
+MAX_ACK_IDS = 500
+
+
+def _parse_message_ids(data):
+    """The positive integer ids in an ack frame; anything else is dropped."""
+    message_ids = data.get('message_ids')
+    if not isinstance(message_ids, list):
+        return set()
+    return {
+        message_id for message_id in message_ids[:MAX_ACK_IDS]
+        if isinstance(message_id, int) and not isinstance(message_id, bool) and message_id > 0
+    }
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    One socket per signed-in user, carrying all of their conversations.
+
+    It joins the `chat_{pk}` group of every conversation the user is in plus
+    their personal `user_{id}` group. Client frames say which conversation
+    they are about with `conversation_id`; frames sent back carry it too.
+    """
+
     async def connect(self):
         self.user = self.scope["user"]
-        
+
         if not self.user.is_authenticated:
             await self.close()
             return
 
-        self.conversation_id = self.scope['url_route']['kwargs']['pk']
-        self.room_group_name = f'chat_{self.conversation_id}'
-        
-        is_participant = await self.is_user_participant(self.user, self.conversation_id)
-        if not is_participant:
-            await self.close()
-            return
+        self.user_group_name = f'user_{self.user.id}'
+        self.conversation_ids = await self.get_conversation_ids()
+        # conversation_id -> (delivered ids, read ids) waiting for the next flush
+        self.pending_acks = {}
+        self.ack_flush = None
+        # Held while a flush writes, so disconnect() waits for it instead of racing it.
+        self.ack_lock = asyncio.Lock()
 
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        for conversation_id in self.conversation_ids:
+            await self.channel_layer.group_add(f'chat_{conversation_id}', self.channel_name)
         await self.accept()
+        presence.ensure_flusher()
 
-        # 1. Announce your own presence to the group (for others' benefit)
-        await self.update_user_status(is_online=True)
+        # 1. Announce your own presence to every conversation (for others' benefit),
+        #    unless another tab already had you online
+        if await sync_to_async(presence.connect)(self.user.id):
+            await self.update_user_status(is_online=True)
 
-        # 2. Get the other user's status and send it directly to yourself
-        other_user_status = await self.get_other_participant_status()
-        if other_user_status:
-            await self.send(text_data=json.dumps({
-                'type': 'user_status',
-                'user_id': other_user_status['user_id'],
-                'is_online': other_user_status['is_online'],
-                'last_seen': other_user_status['last_seen'],
-            }))
+        # 2. Send yourself the status of everyone you talk to, in one frame
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'users': await self.get_contact_statuses(),
+        }))
 
     async def disconnect(self, close_code):
-        if hasattr(self, 'room_group_name') and self.user.is_authenticated:
-            await self.update_user_status(is_online=False)
-            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if hasattr(self, 'user_group_name'):
+            # Write whatever is still queued; this waits for a flush that is
+            # already writing. A flush still waiting out the coalescing delay
+            # has nothing left to do after that, so it is cancelled.
+            scheduled = self.ack_flush
+            await self.flush_acks()
+            if scheduled is not None:
+                scheduled.cancel()
+            if await sync_to_async(presence.disconnect)(self.user.id):
+                # Gone from every tab: record when, rather than waiting for the next flush.
+                await database_sync_to_async(presence.flush_last_seen)(force=True, user_ids={self.user.id})
+                await self.update_user_status(is_online=False)
+            for conversation_id in self.conversation_ids:
+                await self.channel_layer.group_discard(f'chat_{conversation_id}', self.channel_name)
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
         message_type = data.get('type')
 
+        if message_type == 'heartbeat':
+            if await sync_to_async(presence.heartbeat)(self.user.id):
+                await self.update_user_status(is_online=True)
+            return
+
+        # Every client frame is about one of this user's conversations.
+        conversation_id = data.get('conversation_id')
+        if conversation_id not in self.conversation_ids:
+            return
+
         if message_type == 'chat_message':
-            await self.handle_new_message(data)
+            await self.handle_new_message(conversation_id, data)
         elif message_type == 'delivery_confirmation':
-            await self.handle_delivery_confirmation(data)
+            await self.handle_delivery_confirmation(conversation_id, data)
         elif message_type == 'read_receipt':
-            await self.handle_read_receipt(data)
+            await self.handle_read_receipt(conversation_id, data)
 
     # === Handler Methods ===
-    async def handle_delivery_confirmation(self, data):
+    async def handle_delivery_confirmation(self, conversation_id, data):
         """Handles a delivery confirmation from a client."""
-        message_ids = data.get('message_ids', [])
-        if not message_ids: return
+        self.queue_acks(conversation_id, _parse_message_ids(data), read=False)
 
-        await self.create_delivery_receipts(message_ids)
-        
-        # Broadcast to the group that the messages were delivered
-        payload = {
-            'type': 'broadcast_message_delivered',
-            'message_ids': message_ids,
-            'delivered_to_id': self.user.id,
-        }
-        await self.channel_layer.group_send(self.room_group_name, payload)
-    
-    async def handle_new_message(self, data):
+    async def handle_new_message(self, conversation_id, data):
         message_text = data.get('message', '').strip()
         if not message_text:
             return
-        new_message = await self.create_message(message_text)
+        new_message = await self.create_message(conversation_id, message_text)
         payload = {
             'type': 'broadcast_message',
             'message': {
                 'id': new_message.id,
-                'conversation_id': self.conversation_id,
+                'conversation_id': conversation_id,
                 'sender_id': self.user.id,
                 'sender_username': self.user.username,
                 'text': new_message.text,
@@ -92,43 +135,83 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'files': []
             }
         }
-        await self.channel_layer.group_send(self.room_group_name, payload)
+        await self.channel_layer.group_send(f'chat_{conversation_id}', payload)
 
-    async def handle_read_receipt(self, data):
+    async def handle_read_receipt(self, conversation_id, data):
         """
         Handles a read receipt from a client.
-        Crucially, it also ensures a delivery receipt exists.
+        Reading implies delivery, so both watermarks move together.
         """
-        message_ids = data.get('message_ids', [])
-        if not message_ids: return
-
-        # This is now the single point of truth for marking messages as read.
-        # It creates both delivery and read receipts to ensure consistency.
-        await self.create_delivery_receipts(message_ids)
-        await self.create_read_receipts(message_ids)
-        
-        # Broadcast to the group that the messages were read
-        payload = {
-            'type': 'broadcast_read_receipt',
-            'message_ids': message_ids,
-            'reader_id': self.user.id,
-        }
-        await self.channel_layer.group_send(self.room_group_name, payload)
+        self.queue_acks(conversation_id, _parse_message_ids(data), read=True)
+
+    def queue_acks(self, conversation_id, message_ids, read):
+        """Adds ids to a conversation's pending acks and schedules a flush if none is due yet."""
+        if not message_ids:
+            return
+        delivered_ids, read_ids = self.pending_acks.setdefault(conversation_id, (set(), set()))
+        (read_ids if read else delivered_ids).update(message_ids)
+        if self.ack_flush is None:
+            self.ack_flush = asyncio.create_task(self.flush_acks_later())
+
+    async def flush_acks_later(self):
+        await asyncio.sleep(ACK_COALESCE_SECONDS)
+        await self.flush_acks()
+
+    async def flush_acks(self):
+        """
+        Writes every ack queued since the last flush and broadcasts the
+        result once per conversation.
+        """
+        async with self.ack_lock:
+            pending, self.pending_acks = self.pending_acks, {}
+            self.ack_flush = None
+
+            for conversation_id, (delivered_ids, read_ids) in pending.items():
+                read_up_to, delivered_up_to = await self.store_acks(conversation_id, delivered_ids, read_ids)
+                if read_up_to is None and delivered_up_to is None:
+                    continue
+                await self.channel_layer.group_send(f'chat_{conversation_id}', {
+                    'type': 'broadcast_receipts',
+                    'conversation_id': conversation_id,
+                    'user_id': self.user.id,
+                    'read_up_to': read_up_to,
+                    'delivered_up_to': delivered_up_to,
+                })
+
+    # === Group Membership Events ===
+
+    async def conversation_joined(self, event):
+        """Sent to `user_{id}` when the user is added to a new conversation."""
+        conversation_id = event['conversation_id']
+        if conversation_id not in self.conversation_ids:
+            self.conversation_ids.add(conversation_id)
+            await self.channel_layer.group_add(f'chat_{conversation_id}', self.channel_name)
 
     # === Broadcast Methods (sent to clients) ===
 
-    async def broadcast_message_delivered(self, event):
-        """Sends delivery confirmation to the WebSocket client."""
-        await self.send(text_data=json.dumps({
-            'type': 'message_delivered',
-            'message_ids': event['message_ids'],
-            'delivered_to_id': event['delivered_to_id'],
-        }))
+    async def broadcast_receipts(self, event):
+        """Sends a participant's moved watermarks to the WebSocket client."""
+        if event['delivered_up_to'] is not None:
+            await self.send(text_data=json.dumps({
+                'type': 'message_delivered',
+                'conversation_id': event['conversation_id'],
+                'up_to': event['delivered_up_to'],
+                'delivered_to_id': event['user_id'],
+            }))
+        if event['read_up_to'] is not None:
+            await self.send(text_data=json.dumps({
+                'type': 'messages_read',
+                'conversation_id': event['conversation_id'],
+                'up_to': event['read_up_to'],
+                'reader_id': event['user_id'],
+            }))
 
     async def broadcast_message(self, event):
         await self.send(text_data=json.dumps({'type': 'new_message', 'message': event['message']}))
 
     async def broadcast_user_status(self, event):
+        if event['user_id'] == self.user.id:
+            return
         await self.send(text_data=json.dumps({
             'type': 'user_status',
             'user_id': event['user_id'],
@@ -136,42 +219,63 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'last_seen': event.get('last_seen'),
         }))
 
-    async def broadcast_read_receipt(self, event):
-        await self.send(text_data=json.dumps({'type': 'messages_read', 'message_ids': event['message_ids'], 'reader_id': event['reader_id']}))
+    async def notification_created(self, event):
+        """Sent to `user_{id}` by core.notifications.notify()."""
+        await self.send(text_data=json.dumps({
+            'type': 'notification',
+            'count': event['count'],
+            'actor': event['actor'],
+            'verb': event['verb'],
+            'link': event['link'],
+        }))
 
     async def broadcast_message_deleted(self, event):
-        await self.send(text_data=json.dumps({'type': 'message_deleted', 'message_id': event['message_id']}))
+        await self.send(text_data=json.dumps({
+            'type': 'message_deleted',
+            'conversation_id': event['conversation_id'],
+            'message_id': event['message_id'],
+        }))
 
     # === DB & Helper Methods ===
 
     async def update_user_status(self, is_online):
-        last_seen_iso = await self.update_profile_last_seen(is_online)
-        await self.channel_layer.group_send(self.room_group_name, {
-            'type': 'broadcast_user_status',
-            'user_id': self.user.id,
-            'is_online': is_online,
-            'last_seen': last_seen_iso,
-        })
+        last_seen_iso = timezone.now().isoformat()
+        for conversation_id in self.conversation_ids:
+            await self.channel_layer.group_send(f'chat_{conversation_id}', {
+                'type': 'broadcast_user_status',
+                'user_id': self.user.id,
+                'is_online': is_online,
+                'last_seen': last_seen_iso,
+            })
 
     @database_sync_to_async
-    def create_delivery_receipts(self, message_ids):
-        """Creates DeliveryReceipt objects for a list of message IDs."""
-        messages = Message.objects.filter(id__in=message_ids).exclude(sender=self.user)
-        receipts = [
-            DeliveryReceipt(message=msg, user=self.user)
-            for msg in messages
-            if not DeliveryReceipt.objects.filter(message=msg, user=self.user).exists()
-        ]
-        DeliveryReceipt.objects.bulk_create(receipts)
+    def store_acks(self, conversation_id, delivered_ids, read_ids):
+        """
+        Advances this user's watermarks to the newest acknowledged messages
+        that were sent to them in the conversation; ids from other chats or
+        of their own messages are ignored. One SELECT and at most one UPDATE.
+        Returns (read_up_to, delivered_up_to), None for each that did not move.
+        """
+        newest = Message.objects.filter(
+            conversation_id=conversation_id, id__in=delivered_ids | read_ids
+        ).exclude(sender=self.user).aggregate(
+            read=Max('id', filter=Q(id__in=read_ids)),
+            delivered=Max('id'),
+        )
+        if newest['delivered'] is None:
+            return None, None
+        return advance_watermarks(
+            conversation_id, self.user, newest['read'] or 0, newest['delivered']
+        )
 
     @database_sync_to_async
-    def is_user_participant(self, user, conversation_id):
-        return Conversation.objects.filter(id=conversation_id, participants=user).exists()
+    def get_conversation_ids(self):
+        return set(ConversationParticipant.objects.filter(user=self.user).values_list('conversation_id', flat=True))
 
     @database_sync_to_async
-    def create_message(self, text):
+    def create_message(self, conversation_id, text):
         """Saves a new message and resurrects the conversation if needed."""
-        convo = Conversation.objects.get(id=self.conversation_id)
+        convo = Conversation.objects.get(id=conversation_id)
 
         # --- ADD THIS RESURRECTION LOGIC ---
         if convo.deleted_by.exists():
@@ -179,36 +283,26 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # --- END OF ADDITION ---
 
         msg = Message.objects.create(conversation=convo, sender=self.user, text=text)
-        convo.save() # Updates `updated_at` for sorting
+        record_latest_message(msg) # Updates the snapshot and `updated_at` for sorting
+        refresh_conversation_counters([convo.pk])
         return msg
 
     @database_sync_to_async
-    def create_read_receipts(self, message_ids):
-        messages = Message.objects.filter(id__in=message_ids).exclude(sender=self.user)
-        receipts = [ReadReceipt(message=msg, user=self.user) for msg in messages if not ReadReceipt.objects.filter(message=msg, user=self.user).exists()]
-        ReadReceipt.objects.bulk_create(receipts)
-
-    @database_sync_to_async
-    def update_profile_last_seen(self, is_online):
-        profile, _ = Profile.objects.get_or_create(user=self.user)
-        profile.last_seen = timezone.now()
-        profile.save()
-        return profile.last_seen.isoformat()
-    
-    @database_sync_to_async
-    def get_other_participant_status(self):
-        """Fetches the profile and online status of the other user in the conversation."""
-        try:
-            # Use prefetch_related for a more efficient query
-            conversation = Conversation.objects.prefetch_related('participants__profile').get(id=self.conversation_id)
-            other_user = conversation.participants.exclude(id=self.user.id).first()
-            if other_user and hasattr(other_user, 'profile'):
-                profile = other_user.profile
-                return {
-                    'user_id': other_user.id,
-                    'is_online': profile.is_online(),
-                    'last_seen': profile.last_seen.isoformat() if profile.last_seen else None,
-                }
-        except Conversation.DoesNotExist:
-            return None
-        return None
\ No newline at end of file
+    def get_contact_statuses(self):
+        """
+        Status of everyone the user shares a conversation with: online state
+        from the presence cache, last_seen from one query plus unflushed activity.
+        """
+        last_seen = dict(Profile.objects.filter(
+            user__conversation_memberships__conversation_id__in=self.conversation_ids
+        ).exclude(user=self.user).values_list('user_id', 'last_seen').distinct())
+        last_seen.update(presence.pending_last_seen(last_seen))
+        online = presence.online_user_ids(last_seen)
+        return [
+            {
+                'user_id': user_id,
+                'is_online': user_id in online,
+                'last_seen': seen.isoformat() if seen else None,
+            }
+            for user_id, seen in last_seen.items()
+        ]
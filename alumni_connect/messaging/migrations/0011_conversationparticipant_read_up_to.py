@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def initialize_read_up_to(apps, schema_editor):
+    """Starts each watermark at the newest message the participant has a read receipt for."""
+    ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+    ReadReceipt = apps.get_model('messaging', 'ReadReceipt')
+    newest_read = ReadReceipt.objects.filter(
+        user_id=OuterRef('user_id'),
+        message__conversation_id=OuterRef('conversation_id'),
+    ).order_by('-message_id').values('message_id')[:1]
+    ConversationParticipant.objects.update(read_up_to=Coalesce(Subquery(newest_read), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_deliveryreceipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='read_up_to',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(initialize_read_up_to, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+PREVIEW_LENGTH = 100
+
+
+def backfill_snapshots(apps, schema_editor):
+    """Points every conversation at its newest message, in batches."""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    newest_ids = dict(
+        Conversation.objects.annotate(newest_id=Max('messages__id'))
+        .filter(newest_id__isnull=False).values_list('id', 'newest_id')
+    )
+    conversation_ids = list(newest_ids)
+    for start in range(0, len(conversation_ids), 500):
+        batch = conversation_ids[start:start + 500]
+        messages = Message.objects.in_bulk([newest_ids[conversation_id] for conversation_id in batch])
+        with_files = set(Message.files.through.objects.filter(
+            message_id__in=messages
+        ).values_list('message_id', flat=True))
+        conversations = Conversation.objects.in_bulk(batch)
+        for conversation_id, conversation in conversations.items():
+            message = messages[newest_ids[conversation_id]]
+            conversation.latest_message_id = message.id
+            conversation.latest_sender_id = message.sender_id
+            conversation.latest_preview = message.text[:PREVIEW_LENGTH]
+            conversation.latest_created_at = message.created_at
+            conversation.latest_has_attachments = message.id in with_files
+        Conversation.objects.bulk_update(conversations.values(), [
+            'latest_message', 'latest_sender', 'latest_preview', 'latest_created_at', 'latest_has_attachments',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_conversationparticipant_read_up_to'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='latest_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='latest_has_attachments',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='latest_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='latest_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='latest_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def collapse_receipts(apps, schema_editor):
+    """
+    Folds the per-message receipt rows into each participant's watermarks:
+    the newest message they have a receipt for. Reading implies delivery,
+    so delivered_up_to never ends up behind read_up_to.
+    """
+    ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+    ReadReceipt = apps.get_model('messaging', 'ReadReceipt')
+    DeliveryReceipt = apps.get_model('messaging', 'DeliveryReceipt')
+
+    def newest(receipts):
+        return Coalesce(Subquery(receipts.objects.filter(
+            user_id=OuterRef('user_id'),
+            message__conversation_id=OuterRef('conversation_id'),
+        ).order_by('-message_id').values('message_id')[:1]), 0)
+
+    # Receipts written since 0011 initialised read_up_to can only move it forward.
+    ConversationParticipant.objects.update(read_up_to=Greatest('read_up_to', newest(ReadReceipt)))
+    ConversationParticipant.objects.update(delivered_up_to=Greatest('read_up_to', newest(DeliveryReceipt)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0013_message_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='delivered_up_to',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(collapse_receipts, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='readreceipt',
+            unique_together=None,
+        ),
+        migrations.RemoveField(
+            model_name='readreceipt',
+            name='message',
+        ),
+        migrations.RemoveField(
+            model_name='readreceipt',
+            name='user',
+        ),
+        migrations.DeleteModel(
+            name='DeliveryReceipt',
+        ),
+        migrations.DeleteModel(
+            name='ReadReceipt',
+        ),
+    ]
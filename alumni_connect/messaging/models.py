@@ -10,14 +10,27 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     deleted_by = models.ManyToManyField(User, related_name="deleted_conversations", blank=True)
+
+    # Snapshot of the newest message, maintained by messaging.utils so the
+    # inbox and unread badges read columns instead of sorting messages.
+    latest_message = models.ForeignKey("Message", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    latest_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    latest_preview = models.CharField(max_length=100, blank=True)
+    latest_created_at = models.DateTimeField(null=True, blank=True)
+    latest_has_attachments = models.BooleanField(default=False)
     
     def last_message(self):
-        return self.messages.order_by("-created_at").first()
+        return self.latest_message
 
 class ConversationParticipant(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="memberships")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversation_memberships")
     joined_at = models.DateTimeField(auto_now_add=True)
+    # Receipt watermarks: ids of the newest message this participant has read /
+    # has had delivered. Both only move forward (messaging.utils), and
+    # read_up_to <= delivered_up_to.
+    read_up_to = models.BigIntegerField(default=0)
+    delivered_up_to = models.BigIntegerField(default=0)
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="messages")
@@ -30,38 +43,15 @@ class Message(models.Model):
     
     class Meta:
         ordering = ["created_at"]
-
-    def is_delivered_to_all(self):
-        """Checks if the message has been delivered to all participants except the sender."""
-        participants_count = self.conversation.participants.exclude(id=self.sender.id).count()
-        return self.delivery_receipts.count() >= participants_count
-
-    def is_read_by_all(self):
-        """Checks if the message has been read by all participants except the sender."""
-        participants_count = self.conversation.participants.exclude(id=self.sender.id).count()
-        return self.receipts.count() >= participants_count
+        indexes = [
+            # Keyset pagination of a conversation's history (messaging.utils.message_page).
+            models.Index(fields=["conversation", "created_at", "id"], name="message_history_idx"),
+        ]
 
 class MessageFile(models.Model):
     file = models.FileField(upload_to='message_files/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
-class DeliveryReceipt(models.Model):
-    """Tracks when a message is successfully delivered to a user's client."""
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='delivery_receipts')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='delivery_receipts')
-    delivered_at = models.DateTimeField(auto_now_add=True)
-    
-    class Meta:
-        unique_together = ('message', 'user')
-
-class ReadReceipt(models.Model):
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='receipts')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='receipts')
-    read_at = models.DateTimeField(auto_now_add=True)
-    
-    class Meta:
-        unique_together = ('message', 'user')
-
 class Report(models.Model):
     reporter = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reports_made')
     reported_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reports_received')
@@ -0,0 +1,154 @@
+# messaging/presence.py
+#
+# Who is online, kept in the 'presence' cache rather than the database.
+#
+# Each user's entry counts their open sockets and expires PRESENCE_TTL
+# seconds after the last heartbeat, so a worker that dies without running
+# disconnect() cannot leave anybody online for good. The counts must be seen
+# by every ASGI worker (a user's tabs can land on different ones), so the
+# 'presence' cache has to be shared: settings point it at Redis.
+#
+# Profile.last_seen is buffered in this process and written with one
+# bulk_update per LAST_SEEN_FLUSH_INTERVAL, at most once per user per
+# interval, so users flapping between tabs don't cost a write per reconnect.
+# A user's value is written straight away when their last socket closes, and
+# whatever is left is written at interpreter exit.
+
+import asyncio
+import atexit
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
+
+from core.models import Profile
+
+PRESENCE_CACHE = 'presence'
+SOCKETS_KEY = 'presence:sockets:{}'
+# Seconds a user stays online without a heartbeat; the inbox heartbeats every 25s.
+PRESENCE_TTL = 60
+# Seconds between last_seen flushes, which is also the least time between two writes for one user.
+LAST_SEEN_FLUSH_INTERVAL = 60
+
+_lock = threading.Lock()
+_pending_last_seen = {}  # user_id -> last_seen not yet written
+_written_at = {}  # user_id -> time.monotonic() of the user's last write
+_flusher = None
+
+# Like django.core.cache.cache, but for the shared 'presence' alias.
+cache = ConnectionProxy(caches, PRESENCE_CACHE)
+
+
+def _key(user_id):
+    return SOCKETS_KEY.format(user_id)
+
+
+def connect(user_id):
+    """Counts a newly opened socket. Returns True if the user just came online."""
+    touch_last_seen(user_id)
+    key = _key(user_id)
+    if cache.add(key, 1, PRESENCE_TTL):
+        return True
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr().
+        return cache.add(key, 1, PRESENCE_TTL)
+    cache.touch(key, PRESENCE_TTL)
+    return False
+
+
+def disconnect(user_id):
+    """Counts a closed socket. Returns True if it was the user's last one."""
+    touch_last_seen(user_id)
+    key = _key(user_id)
+    try:
+        remaining = cache.decr(key)
+    except ValueError:
+        return True
+    if remaining <= 0:
+        cache.delete(key)
+        return True
+    return False
+
+
+def heartbeat(user_id):
+    """
+    Keeps the user online for another PRESENCE_TTL seconds. Returns True if
+    their entry had already expired and they just came back online.
+    """
+    touch_last_seen(user_id)
+    if cache.touch(_key(user_id), PRESENCE_TTL):
+        return False
+    return cache.add(_key(user_id), 1, PRESENCE_TTL)
+
+
+def is_online(user_id):
+    return cache.get(_key(user_id), 0) > 0
+
+
+def online_user_ids(user_ids):
+    """The subset of `user_ids` that is online, from one cache round trip."""
+    keys = {_key(user_id): user_id for user_id in user_ids}
+    return {keys[key] for key, count in cache.get_many(keys).items() if count > 0}
+
+
+def touch_last_seen(user_id, when=None):
+    """Records activity; it reaches the database on the next due flush."""
+    with _lock:
+        _pending_last_seen[user_id] = when or timezone.now()
+
+
+def pending_last_seen(user_ids):
+    """{user_id: last_seen} for the given users whose activity isn't flushed yet."""
+    with _lock:
+        return {user_id: _pending_last_seen[user_id] for user_id in user_ids if user_id in _pending_last_seen}
+
+
+def flush_last_seen(force=False, user_ids=None):
+    """
+    Writes buffered last_seen values with a single bulk_update, skipping
+    users written less than LAST_SEEN_FLUSH_INTERVAL ago (unless `force`).
+    `user_ids` limits the flush to those users. Returns the number of
+    profiles written.
+    """
+    now = time.monotonic()
+    with _lock:
+        due = {
+            user_id: seen for user_id, seen in _pending_last_seen.items()
+            if (user_ids is None or user_id in user_ids)
+            and (force or now - _written_at.get(user_id, float('-inf')) >= LAST_SEEN_FLUSH_INTERVAL)
+        }
+        for user_id in due:
+            del _pending_last_seen[user_id]
+            _written_at[user_id] = now
+        # Anyone written longer ago than the interval is due again anyway.
+        for user_id in [u for u, at in _written_at.items() if now - at >= LAST_SEEN_FLUSH_INTERVAL]:
+            del _written_at[user_id]
+    if not due:
+        return 0
+
+    profiles = list(Profile.objects.filter(user_id__in=due).only('id', 'user_id'))
+    for profile in profiles:
+        profile.last_seen = due[profile.user_id]
+    Profile.objects.bulk_update(profiles, ['last_seen'], batch_size=500)
+    return len(profiles)
+
+
+async def _flush_periodically():
+    while True:
+        await asyncio.sleep(LAST_SEEN_FLUSH_INTERVAL)
+        await database_sync_to_async(flush_last_seen)()
+
+
+def ensure_flusher():
+    """Starts this process's background last_seen flusher if it isn't running."""
+    global _flusher
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.get_running_loop().create_task(_flush_periodically())
+
+
+atexit.register(flush_last_seen, force=True)
@@ -3,5 +3,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
-    re_path(r'ws/chat/(?P<pk>\d+)/$', consumers.ChatConsumer.as_asgi()),
+    # One socket per user for all of their conversations
+    re_path(r'ws/chat/$', consumers.ChatConsumer.as_asgi()),
 ]
\ No newline at end of file
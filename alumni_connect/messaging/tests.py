@@ -1,3 +1,103 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
 
-# Create your tests here.
+from core.models import Profile
+
+from .consumers import ChatConsumer
+from .models import Conversation, ConversationParticipant, Message
+from .utils import advance_watermarks, mark_read
+
+
+def create_chat(*users):
+    conversation = Conversation.objects.create()
+    for user in users:
+        ConversationParticipant.objects.create(conversation=conversation, user=user)
+    return conversation
+
+
+class WatermarkTests(TestCase):
+    """read_up_to and delivered_up_to only ever move forward."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pw')
+        cls.bob = User.objects.create_user(username='bob', password='pw')
+        cls.conversation = create_chat(cls.alice, cls.bob)
+        cls.messages = [
+            Message.objects.create(conversation=cls.conversation, sender=cls.alice, text=f'message {i}')
+            for i in range(3)
+        ]
+
+    def watermarks(self):
+        return ConversationParticipant.objects.filter(
+            conversation=self.conversation, user=self.bob
+        ).values_list('read_up_to', 'delivered_up_to').get()
+
+    def test_advance_never_moves_back(self):
+        first, second, third = (message.id for message in self.messages)
+        self.assertEqual(advance_watermarks(self.conversation.id, self.bob, second, third), (second, third))
+        self.assertEqual(advance_watermarks(self.conversation.id, self.bob, first, second), (None, None))
+        self.assertEqual(self.watermarks(), (second, third))
+
+    def test_reading_implies_delivery(self):
+        second = self.messages[1].id
+        self.assertEqual(advance_watermarks(self.conversation.id, self.bob, read_up_to=second), (second, second))
+
+    def test_mark_read_never_moves_back(self):
+        first, third = self.messages[0].id, self.messages[2].id
+        self.assertEqual(mark_read(self.conversation.id, self.bob, third), third)
+        self.assertIsNone(mark_read(self.conversation.id, self.bob, first))
+        self.assertEqual(self.watermarks(), (third, third))
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'presence': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    },
+)
+class ReceiptAckTests(TransactionTestCase):
+    """Acks sent over the socket are validated, coalesced and written."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+        for user in (self.alice, self.bob):
+            Profile.objects.create(user=user, full_name=user.username, user_type='alumni', is_verified=True)
+        self.conversation = create_chat(self.alice, self.bob)
+        self.message = Message.objects.create(conversation=self.conversation, sender=self.alice, text='hi')
+        # A chat bob isn't in.
+        other = create_chat(self.alice)
+        self.foreign_message = Message.objects.create(conversation=other, sender=self.alice, text='not for bob')
+
+    def watermarks(self):
+        return ConversationParticipant.objects.filter(
+            conversation=self.conversation, user=self.bob
+        ).values_list('read_up_to', 'delivered_up_to').get()
+
+    @async_to_sync
+    async def send_acks(self, *frames):
+        """Connects as bob, sends the frames and disconnects straight away."""
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['user'] = self.bob
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # the presence frame
+        for frame in frames:
+            await communicator.send_json_to({'conversation_id': self.conversation.id, **frame})
+        await communicator.disconnect()
+
+    def test_ids_from_other_conversations_are_ignored(self):
+        self.send_acks({'type': 'read_receipt', 'message_ids': [self.foreign_message.id]})
+        self.assertEqual(self.watermarks(), (0, 0))
+
+    def test_coalesced_acks_are_flushed_on_disconnect(self):
+        # Disconnecting well inside ACK_COALESCE_SECONDS.
+        self.send_acks(
+            {'type': 'delivery_confirmation', 'message_ids': [self.message.id]},
+            {'type': 'read_receipt', 'message_ids': [self.message.id, self.foreign_message.id, 'x']},
+        )
+        self.assertEqual(self.watermarks(), (self.message.id, self.message.id))
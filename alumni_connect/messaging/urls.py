@@ -13,6 +13,7 @@ urlpatterns = [
     # AJAX Endpoints (called by JavaScript)
     path("send/<int:pk>/", views.send_message_ajax, name="send_message_ajax"),
     path("fetch-html/<int:pk>/", views.fetch_conversation_html, name="fetch_conversation_html"),
+    path("history/<int:pk>/", views.message_history, name="message_history"),
     path("delete-message/<int:pk>/", views.delete_message_ajax, name="delete_message"),
     path("delete-bulk/", views.delete_messages_bulk_ajax, name="delete_messages_bulk_ajax"),
     path("leave/<int:pk>/", views.leave_conversation_ajax, name="leave_conversation_ajax"),
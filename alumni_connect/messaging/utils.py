@@ -0,0 +1,202 @@
+# messaging/utils.py
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Conversation, ConversationParticipant, Message
+
+# Characters of message text kept in Conversation.latest_preview.
+PREVIEW_LENGTH = 100
+
+# Messages per page of conversation history, and the most a client may ask for.
+HISTORY_PAGE_SIZE = 30
+MAX_HISTORY_PAGE_SIZE = 100
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(message):
+    """Opaque 'before' cursor for a message: '<created_at in epoch microseconds>-<id>'."""
+    delta = message.created_at - EPOCH
+    return f"{(delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds}-{message.id}"
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(); raises ValueError for anything malformed."""
+    micros, message_id = cursor.split('-')
+    return EPOCH + timedelta(microseconds=int(micros)), int(message_id)
+
+
+def message_page(conversation, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One page of a conversation's history, oldest first: the `limit` newest
+    messages strictly older than the `before` cursor (or the newest overall).
+    Returns (messages, cursor for the next older page or None). Seeks on the
+    (conversation, created_at, id) index, so cost doesn't grow with history.
+    """
+    messages = conversation.messages.select_related('sender').prefetch_related('files')
+    if before is not None:
+        created_at, message_id = decode_cursor(before)
+        messages = messages.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id)
+        )
+    page = list(messages.order_by('-created_at', '-id')[:limit + 1])
+    older = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit][::-1], older
+
+
+def _snapshot_fields(message, has_attachments):
+    return {
+        'latest_message_id': message.id,
+        'latest_sender_id': message.sender_id,
+        'latest_preview': message.text[:PREVIEW_LENGTH],
+        'latest_created_at': message.created_at,
+        'latest_has_attachments': has_attachments,
+    }
+
+
+def record_latest_message(message, has_attachments=False):
+    """
+    Advances the conversation's latest-message snapshot to `message` and
+    bumps updated_at, in one conditional UPDATE that never moves the
+    snapshot backwards if a newer message got there first.
+    """
+    now = timezone.now()
+    advanced = Conversation.objects.filter(pk=message.conversation_id).filter(
+        Q(latest_message_id__isnull=True) | Q(latest_message_id__lt=message.id)
+    ).update(updated_at=now, **_snapshot_fields(message, has_attachments))
+    if not advanced:
+        Conversation.objects.filter(pk=message.conversation_id).update(updated_at=now)
+
+
+def refresh_latest_message(conversation_ids):
+    """Re-points the snapshot at the newest remaining message, after deletions."""
+    for conversation_id in set(conversation_ids):
+        newest = Message.objects.filter(conversation_id=conversation_id).annotate(
+            has_attachments=Exists(Message.files.through.objects.filter(message_id=OuterRef('pk')))
+        ).order_by('-id').first()
+        if newest is None:
+            fields = {
+                'latest_message_id': None, 'latest_sender_id': None, 'latest_preview': '',
+                'latest_created_at': None, 'latest_has_attachments': False,
+            }
+            # Any pointer at all must be a message sent after the query above.
+            newer = Q(latest_message_id__isnull=False)
+        else:
+            fields = _snapshot_fields(newest, newest.has_attachments)
+            # Leave it alone if a message newer than `newest` was recorded meanwhile.
+            newer = Q(latest_message_id__gt=newest.id)
+        Conversation.objects.filter(pk=conversation_id).exclude(newer).update(**fields)
+
+
+def _unread_memberships():
+    """
+    Memberships whose conversation's latest message came from someone else
+    and is newer than that participant's read watermark.
+    """
+    return ConversationParticipant.objects.filter(
+        conversation__latest_message_id__gt=F('read_up_to')
+    ).filter(~Q(conversation__latest_sender_id=F('user_id')))
+
+
+def unread_conversation_count(user):
+    """Number of the user's conversations with unread messages. One query."""
+    return _unread_memberships().filter(user=user).count()
+
+
+def unread_conversation_counts(user_ids=None):
+    """{user_id: unread conversation count} for the given users (or everyone), in one query."""
+    memberships = _unread_memberships()
+    if user_ids is not None:
+        memberships = memberships.filter(user_id__in=user_ids)
+    return dict(memberships.values('user_id').annotate(unread=Count('id')).values_list('user_id', 'unread'))
+
+
+def _latest_message_id(conversation_id):
+    return Conversation.objects.filter(pk=conversation_id).values_list('latest_message_id', flat=True).first()
+
+
+def mark_read(conversation_id, user, up_to=None):
+    """
+    Moves the user's read watermark forward to message id `up_to` (default:
+    the newest message in the conversation), and the delivery watermark with
+    it, in one UPDATE. Never moves either backwards.
+    Returns `up_to` if the read watermark moved, else None.
+    """
+    from core.counters import refresh_unread_conversations
+
+    if up_to is None:
+        up_to = _latest_message_id(conversation_id)
+        if up_to is None:
+            return None
+    moved = ConversationParticipant.objects.filter(
+        conversation_id=conversation_id, user=user, read_up_to__lt=up_to
+    ).update(read_up_to=up_to, delivered_up_to=Greatest('delivered_up_to', up_to))
+    if not moved:
+        return None
+    refresh_unread_conversations([user.pk])
+    return up_to
+
+
+def advance_watermarks(conversation_id, user, read_up_to=0, delivered_up_to=0):
+    """
+    Moves both of the user's watermarks forward in a single UPDATE (reading
+    implies delivery). Returns (read_up_to, delivered_up_to), with None for
+    a watermark that was already at or past the given id.
+    """
+    from core.counters import refresh_unread_conversations
+
+    delivered_up_to = max(delivered_up_to, read_up_to)
+    current = ConversationParticipant.objects.filter(
+        conversation_id=conversation_id, user=user
+    ).values_list('read_up_to', 'delivered_up_to').first()
+    if current is None:
+        return None, None
+    read_moved, delivered_moved = read_up_to > current[0], delivered_up_to > current[1]
+    if not (read_moved or delivered_moved):
+        return None, None
+    # Greatest() keeps this monotonic even if another connection moved them meanwhile.
+    ConversationParticipant.objects.filter(conversation_id=conversation_id, user=user).update(
+        read_up_to=Greatest('read_up_to', read_up_to),
+        delivered_up_to=Greatest('delivered_up_to', delivered_up_to),
+    )
+    if read_moved:
+        refresh_unread_conversations([user.pk])
+    return (read_up_to if read_moved else None), (delivered_up_to if delivered_moved else None)
+
+
+def apply_receipts(messages, conversation, user):
+    """
+    Sets the receipt flags the chat templates read on each message, from the
+    participants' watermarks in a single query:
+    is_read_by_all / is_delivered_to_all for messages `user` sent, and
+    is_unread_by_me for messages they received.
+    """
+    read_up_to = delivered_up_to = 0
+    others_read, others_delivered = [], []
+    for user_id, read, delivered in conversation.memberships.values_list('user_id', 'read_up_to', 'delivered_up_to'):
+        if user_id == user.pk:
+            read_up_to, delivered_up_to = read, delivered
+        else:
+            others_read.append(read)
+            others_delivered.append(delivered)
+
+    for message in messages:
+        # With nobody else left in the chat, there is no one to wait for.
+        message.is_read_by_all = all(message.id <= read for read in others_read)
+        message.is_delivered_to_all = all(message.id <= delivered for delivered in others_delivered)
+        message.is_unread_by_me = message.sender_id != user.pk and message.id > read_up_to
+    return messages
+
+
+def refresh_conversation_counters(conversation_ids):
+    """Recomputes the unread badge of everyone in the given conversations."""
+    from core.counters import refresh_unread_conversations
+
+    user_ids = set(ConversationParticipant.objects.filter(
+        conversation_id__in=conversation_ids
+    ).values_list('user_id', flat=True))
+    refresh_unread_conversations(user_ids)
@@ -3,9 +3,8 @@ from django.urls import reverse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from .models import Conversation, ReadReceipt, DeliveryReceipt
-from django.db.models import Count, Q
-from django.http import JsonResponse, HttpResponseForbidden
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.contrib import messages as flash_messages
 from django.utils import timezone
 from django.views.decorators.http import require_POST
@@ -14,6 +13,11 @@ from asgiref.sync import async_to_sync
 
 
 from .models import Conversation, ConversationParticipant, Message, MessageFile
+from .utils import (
+    HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE, apply_receipts, mark_read, message_page,
+    record_latest_message, refresh_conversation_counters, refresh_latest_message,
+)
+from core.counters import refresh_unread_conversations
 from core.models import Connection, Profile
 
 User = get_user_model()
@@ -45,6 +49,12 @@ def _get_or_create_1to1_conversation(user1, user2):
     if created:
         ConversationParticipant.objects.create(conversation=conversation, user=user1)
         ConversationParticipant.objects.create(conversation=conversation, user=user2)
+        # Subscribe both users' open sockets to the new conversation's group.
+        channel_layer = get_channel_layer()
+        for user in (user1, user2):
+            async_to_sync(channel_layer.group_send)(
+                f'user_{user.id}', {'type': 'conversation_joined', 'conversation_id': conversation.pk}
+            )
 
     return conversation
 
@@ -58,20 +68,35 @@ def inbox(request):
     # --- NEW LOGIC: Check for a filter in the URL ---
     filter_type = request.GET.get('filter')
     
-    # Start with all of the user's conversations
-    convs = request.user.conversations.all().exclude(deleted_by=request.user).order_by("-updated_at")
+    # Start with all of the user's conversations. The latest message is a
+    # snapshot on the conversation row and the other participant(s) come from
+    # one prefetch, so the whole list renders from a constant number of queries.
+    convs = request.user.conversations.exclude(deleted_by=request.user).prefetch_related(
+        Prefetch(
+            'memberships',
+            queryset=ConversationParticipant.objects.exclude(user=request.user).select_related('user__profile'),
+            to_attr='other_memberships',
+        )
+    ).order_by("-updated_at")
 
     if filter_type == 'students':
-        convs = convs.filter(memberships__user__profile__user_type='student')
+        # EXISTS rather than a join, so a conversation is listed only once.
+        convs = convs.filter(Exists(ConversationParticipant.objects.filter(
+            conversation=OuterRef('pk'), user__profile__user_type='student'
+        )))
 
     conv_list = []
     for c in convs:
-        other = c.participants.exclude(pk=request.user.pk).first()
-        last = c.last_message()
+        other = c.other_memberships[0].user if c.other_memberships else None
+        last = None
         last_message_text = "No messages yet"
-        if last:
-            sender_prefix = "You: " if last.sender == request.user else ""
-            last_message_text = f"{sender_prefix}{last.text}"
+        if c.latest_message_id is not None:
+            last = {
+                'id': c.latest_message_id, 'text': c.latest_preview, 'sender_id': c.latest_sender_id,
+                'created_at': c.latest_created_at, 'has_attachments': c.latest_has_attachments,
+            }
+            sender_prefix = "You: " if c.latest_sender_id == request.user.id else ""
+            last_message_text = f"{sender_prefix}{c.latest_preview}"
 
         conv_list.append({
             "conversation": c, 
@@ -80,7 +105,7 @@ def inbox(request):
             "last_message_text": last_message_text # Pass this new text to the template
         })
     
-    profile = get_object_or_404(Profile, user=request.user)
+    profile = request.profile
     context = { "conversations": conv_list, "profile": profile, "active_filter": filter_type }
     return render(request, "messaging/inbox.html", context)
 
@@ -126,21 +151,19 @@ def conversation_view(request, pk):
         flash_messages.error(request, "Messaging is available after your profile is verified.")
         return redirect("core:account_settings")
     
-    participant = ConversationParticipant.objects.get(
-        conversation=convo,
-        user=request.user
-    )
-    # Update the timestamp to now
-    participant.last_read_at = timezone.now()
-    participant.save(update_fields=['last_read_at'])
+    # Everything up to the newest message is now read
+    mark_read(convo.pk, request.user)
 
-    messages_qs = convo.messages.select_related("sender").all()  # ordered by created_at by model Meta
+    # Only the newest page; older messages are loaded on demand via fetch_conversation_html
+    page, older_cursor = message_page(convo)
+    apply_receipts(page, convo, request.user)
     other = convo.participants.exclude(pk=request.user.pk).first()
     
-    profile = get_object_or_404(Profile, user=request.user)
+    profile = request.profile
     context = {
         "conversation": convo,
-        "messages": messages_qs,
+        "messages": page,
+        "older_cursor": older_cursor,
         "other_user": other,
         "profile": profile, # <-- Add the profile here
     }
@@ -189,8 +212,9 @@ def send_message_ajax(request, pk):
             'name': str(f.name) # Use the original filename
         })
 
-    # Trigger the `updated_at` field on the conversation
-    convo.save()
+    # Point the conversation's snapshot at this message (also bumps `updated_at`)
+    record_latest_message(msg, has_attachments=bool(file_data_list))
+    refresh_conversation_counters([convo.pk])
 
     # Broadcast the new message data to the WebSocket group
     channel_layer = get_channel_layer()
@@ -248,60 +272,81 @@ def fetch_messages(request, pk):
 
     return JsonResponse({"ok": True, "messages": data})
 
+
 @login_required
-def fetch_conversation_html(request, pk):
+def message_history(request, pk):
     """
-    AJAX endpoint: Fetches chat HTML and robustly marks all waiting
-    messages as both DELIVERED and READ.
+    AJAX endpoint: one page of history as JSON, newest page first.
+    `?before=<cursor>` continues from the `older_cursor` of the previous page;
+    `?limit=` caps the page size. Messages use the WebSocket broadcast structure.
     """
-    convo = get_object_or_404(Conversation.objects.prefetch_related('messages'), pk=pk, participants=request.user)
-    channel_layer = get_channel_layer()
+    convo = get_object_or_404(Conversation, pk=pk, participants=request.user)
+    try:
+        limit = min(max(int(request.GET.get("limit", HISTORY_PAGE_SIZE)), 1), MAX_HISTORY_PAGE_SIZE)
+        page, older_cursor = message_page(convo, request.GET.get("before"), limit)
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "Invalid cursor or limit."}, status=400)
+
+    data = [
+        {
+            'id': m.id,
+            'conversation_id': convo.pk,
+            'sender_id': m.sender_id,
+            'sender_username': m.sender.username,
+            'text': m.text,
+            'created_at': m.created_at.isoformat(),
+            'created_at_formatted': m.created_at.strftime('%H:%M'),
+            'files': [{'url': f.file.url, 'name': str(f.file.name).split('/')[-1]} for f in m.files.all()],
+        }
+        for m in page
+    ]
+    return JsonResponse({"ok": True, "messages": data, "older_cursor": older_cursor})
 
-    # --- FIX PART 1: Handle DELIVERY Receipts ---
-    # Find messages from others that this user has NOT received a delivery receipt for.
-    messages_to_mark_delivered = convo.messages.exclude(sender=request.user).exclude(delivery_receipts__user=request.user)
-    delivered_message_ids = list(messages_to_mark_delivered.values_list('id', flat=True))
 
-    if delivered_message_ids:
-        receipts_to_create = [DeliveryReceipt(message_id=msg_id, user=request.user) for msg_id in delivered_message_ids]
-        DeliveryReceipt.objects.bulk_create(receipts_to_create)
-        
-        # Broadcast that these messages were DELIVERED
-        async_to_sync(channel_layer.group_send)(
-            f'chat_{pk}',
-            {
-                'type': 'broadcast_message_delivered',
-                'message_ids': delivered_message_ids,
-                'delivered_to_id': request.user.id
-            }
-        )
+@login_required
+def fetch_conversation_html(request, pk):
+    """
+    AJAX endpoint: Fetches chat HTML and marks the conversation as
+    delivered and read by advancing the user's watermarks.
+    With `?before=<cursor>` it returns just the next page of older messages.
+    """
+    convo = get_object_or_404(Conversation, pk=pk, participants=request.user)
 
-    # --- FIX PART 2: Handle READ Receipts ---
-    # Find messages from others that this user has NOT read yet.
-    messages_to_mark_as_read = convo.messages.exclude(sender=request.user).exclude(receipts__user=request.user)
-    read_message_ids = list(messages_to_mark_as_read.values_list('id', flat=True))
+    if "before" in request.GET:
+        try:
+            page, older_cursor = message_page(convo, request.GET["before"])
+        except ValueError:
+            return HttpResponseBadRequest("Invalid cursor.")
+        apply_receipts(page, convo, request.user)
+        return render(request, "messaging/_message_list.html", {
+            "conversation": convo,
+            "messages": page,
+            "older_cursor": older_cursor,
+        })
 
-    if read_message_ids:
-        receipts_to_create = [ReadReceipt(message_id=msg_id, user=request.user) for msg_id in read_message_ids]
-        ReadReceipt.objects.bulk_create(receipts_to_create)
-        
-        # Broadcast that these messages were READ
-        async_to_sync(channel_layer.group_send)(
+    # Everything up to the newest message is now delivered and read: one UPDATE.
+    read_up_to = mark_read(convo.pk, request.user)
+    if read_up_to is not None:
+        async_to_sync(get_channel_layer().group_send)(
             f'chat_{pk}',
             {
-                'type': 'broadcast_read_receipt',
-                'message_ids': read_message_ids,
-                'reader_id': request.user.id
+                'type': 'broadcast_receipts',
+                'conversation_id': convo.pk,
+                'user_id': request.user.id,
+                'read_up_to': read_up_to,
+                'delivered_up_to': None,  # implied by the read watermark
             }
         )
 
-    # Prepare context for rendering the template
-    messages_qs = convo.messages.select_related("sender").prefetch_related('delivery_receipts', 'receipts').all()
+    # Prepare context for rendering the template: the newest page only
+    page, older_cursor = message_page(convo)
+    apply_receipts(page, convo, request.user)
     other = convo.participants.exclude(pk=request.user.pk).first()
     
     context = {
         "conversation": convo,
-        "messages": messages_qs,
+        "messages": page,
+        "older_cursor": older_cursor,
         "other_user": other,
     }
     return render(request, "messaging/_chat_window.html", context)
@@ -322,7 +367,9 @@ def leave_conversation_ajax(request, pk):
         # --- NEW LOGIC: Check if it should be permanently deleted ---
         if convo.deleted_by.count() >= convo.participants.count():
             # If everyone has "deleted" the chat, remove it for real
+            participant_ids = list(convo.memberships.values_list('user_id', flat=True))
             convo.delete()
+            refresh_unread_conversations(participant_ids)
         
         return JsonResponse({"ok": True})
 
@@ -342,6 +389,8 @@ def delete_message_ajax(request, pk):
         conversation_id = message.conversation.id
         message_id = message.id
         message.delete()
+        refresh_latest_message([conversation_id])
+        refresh_conversation_counters([conversation_id])
         
         # BROADCAST THE DELETION EVENT
         channel_layer = get_channel_layer()
@@ -349,6 +398,7 @@ def delete_message_ajax(request, pk):
             f'chat_{conversation_id}',
             {
                 'type': 'broadcast_message_deleted',
+                'conversation_id': conversation_id,
                 'message_id': message_id,
             }
         )
@@ -378,8 +428,12 @@ def delete_messages_bulk_ajax(request):
             sender=request.user
         )
         
+        conversation_ids = set(messages_to_delete.values_list('conversation_id', flat=True))
+
         # Get the count before deleting for the response
         count, _ = messages_to_delete.delete()
+        refresh_latest_message(conversation_ids)
+        refresh_conversation_counters(conversation_ids)
 
         return JsonResponse({"ok": True, "deleted_count": count})
 